@@ -0,0 +1,77 @@
+"""Benchmarks utils.dedupe_columns against df.T.drop_duplicates().T.
+
+Builds a season-sized player table (one row per player, stats categories merged side by side, so identifier columns
+like Player, Squad and 90s repeat once per category) and reports time and peak traced memory of both, and whether they
+keep the same columns.
+
+    python benchmarks/column_dedup.py --players 2800 --categories 10 --repeat 3
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import dedupe_columns
+
+STATS_PER_CATEGORY = 25
+
+
+def season_table(n_players: int, n_categories: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    ids = {
+        "Player": [f"Player {i}" for i in range(n_players)],
+        "Squad": [f"Squad {i % 96}" for i in range(n_players)],
+        "Pos": rng.choice(["FW", "MF", "DF", "GK", "FW,MF"], n_players),
+        "Age": rng.integers(16, 40, n_players),
+        "90s": rng.integers(0, 380, n_players) / 10,
+    }
+    columns = dict()
+    for c in range(n_categories):
+        for name, values in ids.items():
+            columns[f"Category{c} {name}"] = values  # repeated in every category, the duplicates to drop
+        for s in range(STATS_PER_CATEGORY):
+            values = rng.integers(0, 50, n_players) if s % 2 else rng.random(n_players).round(2)
+            columns[f"Category{c} Stat{s}"] = values
+    return pd.DataFrame(columns)
+
+
+def measure(func, df: pd.DataFrame, repeat: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(df)
+    elapsed = (time.perf_counter() - start) / repeat
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, default=2800, help="rows, about a big five season")
+    parser.add_argument("--categories", type=int, default=10, help="merged stats categories")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = season_table(args.players, args.categories)
+    print(f"{df.shape[0]} rows x {df.shape[1]} columns, {df.memory_usage(deep=True).sum() / 1024**2:.1f} MB")
+
+    results = dict()
+    for name, func in [("df.T.drop_duplicates().T", lambda df: df.T.drop_duplicates().T), ("dedupe_columns(df)", dedupe_columns)]:
+        result, elapsed, peak = measure(func, df, args.repeat)
+        results[name] = result
+        dtypes = result.dtypes.astype(str).value_counts().to_dict()
+        print(f"{name:<26} {elapsed:.3f}s, peak {peak / 1024**2:.1f} MB, {result.shape[1]} columns kept, dtypes {dtypes}")
+
+    legacy, deduped = results.values()
+    print(f"Same columns kept: {legacy.columns.tolist() == deduped.columns.tolist()}")
+
+
+if __name__ == "__main__":
+    main()
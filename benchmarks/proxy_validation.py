@@ -0,0 +1,114 @@
+"""Benchmarks proxy validation against local stand-in HTTP proxies.
+
+Starts a handful of local "proxies" that answer every request like httpbin.org/ip (and like the WhoScored homepage),
+plus some that hang and some closed ports, then times the legacy thread pool check against the async pipeline.
+
+    python benchmarks/proxy_validation.py --live 20 --hanging 20 --dead 160
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engines import request_utils
+
+CHECK_URL = "http://httpbin.stand-in/ip"
+WHOSCORED_URL = "http://whoscored.stand-in/"
+
+
+class StandInProxy(BaseHTTPRequestHandler):
+    latency = 0.05
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        if self.path.startswith(CHECK_URL):
+            body = json.dumps({"origin": "127.0.0.1"}).encode()
+            content_type = "application/json"
+        else:
+            body = b"<html><head><title>Football Statistics | Football Live Scores | WhoScored.com</title></head></html>"
+            content_type = "text/html"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_live(n):
+    servers = []
+    for _ in range(n):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StandInProxy)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return [f"127.0.0.1:{server.server_address[1]}" for server in servers]
+
+
+def start_hanging(n):
+    # accepts connections but never answers, so every probe runs into its timeout
+    sockets = []
+    for _ in range(n):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        sock.listen(128)
+        sockets.append(sock)
+    return sockets, [f"127.0.0.1:{sock.getsockname()[1]}" for sock in sockets]
+
+
+def dead_ports(n):
+    urls = []
+    for _ in range(n):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        urls.append(f"127.0.0.1:{sock.getsockname()[1]}")
+        sock.close()
+    return urls
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--live", type=int, default=20)
+    parser.add_argument("--hanging", type=int, default=20)
+    parser.add_argument("--dead", type=int, default=160)
+    parser.add_argument("--timeout", type=float, default=1)
+    parser.add_argument("--concurrency", type=int, default=500)
+    args = parser.parse_args()
+
+    live = start_live(args.live)
+    _sockets, hanging = start_hanging(args.hanging)
+    candidates = live + hanging + dead_ports(args.dead)
+    print(f"{len(candidates)} candidates: {len(live)} live, {len(hanging)} hanging, {args.dead} dead")
+
+    def legacy_check(proxy_url):
+        # test_proxy with the benchmark's stand-in url; get_my_ip has a hard coded 5s timeout
+        return request_utils.test_proxy(proxy_url, check_url=CHECK_URL)
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=50) as executor:
+        legacy = [proxy for proxy in executor.map(legacy_check, candidates) if proxy]
+    legacy_time = time.perf_counter() - start
+    print(f"thread pool (50 workers, ip probes only): {len(set(legacy))} valid in {legacy_time:.2f}s")
+
+    start = time.perf_counter()
+    ip_only = asyncio.run(
+        request_utils.validate_proxies(candidates, concurrency=args.concurrency, timeout=args.timeout, check_url=CHECK_URL, whoscored_url=None, verbose=False)
+    )
+    print(f"async pipeline (ip probes only): {len(ip_only)} valid in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    full = asyncio.run(
+        request_utils.validate_proxies(
+            candidates, concurrency=args.concurrency, timeout=args.timeout, check_url=CHECK_URL, whoscored_url=WHOSCORED_URL, whoscored_timeout=args.timeout, verbose=False
+        )
+    )
+    print(f"async pipeline (ip probes + WhoScored probe): {len(full)} valid in {time.perf_counter() - start:.2f}s")
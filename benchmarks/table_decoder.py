@@ -0,0 +1,88 @@
+"""Benchmarks the FBRef table decoder against pd.read_html(str(tag)).
+
+Decodes every stats table of a page with both and checks they agree. Runs on a synthetic FBRef-like match page by
+default, or on saved pages (e.g. from a record archive, gunzipped) passed with --html.
+
+    python benchmarks/table_decoder.py --repeat 20
+    python benchmarks/table_decoder.py --html match.html stats.html
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engines.fbref_tables import decode_table, uncomment_tables
+
+GROUPS = [("", ["player", "shirtnumber", "nationality", "position", "age", "minutes"]), ("Performance", ["goals", "assists", "pens_made", "pens_att", "shots", "shots_on_target", "cards_yellow", "cards_red"]), ("Expected", ["xg", "npxg", "xg_assist"]), ("Passes", ["passes_completed", "passes", "passes_pct", "progressive_passes"])]
+
+
+def synthetic_table(table_id: str, n_players: int) -> str:
+    over_header = "".join(f'<th colspan="{len(stats)}" class="over_header">{group}</th>' for group, stats in GROUPS)
+    header = "".join(f'<th scope="col" data-stat="{stat}">{stat.title()}</th>' for _, stats in GROUPS for stat in stats)
+    rows = list()
+    for i in range(n_players):
+        if i and i % 25 == 0:
+            rows.append(f'<tr class="thead">{header}</tr>')
+        cells = [f'<th scope="row" class="left " data-stat="player"><a href="/en/players/{i:08x}/Player-{i}">Player {i}</a></th>']
+        cells += [f'<td data-stat="shirtnumber">{i}</td>', '<td data-stat="nationality"><a href="/en/country/ENG">eng ENG</a></td>', '<td data-stat="position">FW,MF</td>', f'<td data-stat="age">{20 + i % 15}-{i * 7 % 365:03d}</td>', f'<td data-stat="minutes">{1000 + i * 13:,}</td>']
+        cells += [f'<td data-stat="{stat}">{(i * (j + 3)) % 11}</td>' for j, stat in enumerate(GROUPS[1][1])]
+        cells += [f'<td data-stat="{stat}">{"" if i % 9 == 0 else (i * (j + 1)) % 17 / 10}</td>' for j, stat in enumerate(GROUPS[2][1])]
+        cells += [f'<td data-stat="passes_completed">{i * 3}</td>', f'<td data-stat="passes">{i * 4}</td>', f'<td data-stat="passes_pct">{75.0 if i else ""}</td>', f'<td data-stat="progressive_passes">{i % 5}</td>']
+        rows.append(f'<tr>{"".join(cells)}</tr>')
+    footer = '<th scope="row" class="left " data-stat="player">Squad Total</th>' + "".join(f'<td data-stat="{stat}">1</td>' for _, stats in GROUPS for stat in stats if stat != "player")
+    return f'<table id="{table_id}"><thead><tr class="over_header">{over_header}</tr><tr>{header}</tr></thead><tbody>{"".join(rows)}</tbody><tfoot><tr>{footer}</tr></tfoot></table>'
+
+
+def synthetic_page(n_tables: int = 16, n_players: int = 16) -> str:
+    tables = "".join(f"<div><!-- {synthetic_table(f'stats_{i:08x}_summary', n_players)} --></div>" for i in range(n_tables))
+    return f"<html><body>{tables}</body></html>"
+
+
+def as_text(df: pd.DataFrame) -> pd.DataFrame:
+    # "1" from a string column and 1.0 from a float column are the same cell
+    return df.apply(lambda col: [("" if pd.isna(v) else f"{float(v):g}" if str(v).replace(".", "", 1).isdigit() or isinstance(v, (int, float)) else str(v)) for v in col])
+
+
+def compare(legacy: pd.DataFrame, decoded: pd.DataFrame) -> bool:
+    # read_html keeps the repeated header rows, which also leaves their columns as strings
+    first = legacy.columns[0]
+    legacy = legacy[legacy[first] != (first[-1] if isinstance(first, tuple) else first)].reset_index(drop=True)
+    if list(legacy.columns) != list(decoded.columns) or legacy.shape != decoded.shape:
+        return False
+    return as_text(legacy).equals(as_text(decoded))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--html", nargs="*", help="saved FBRef pages to decode instead of the synthetic page")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--players", type=int, default=16, help="rows per synthetic table")
+    args = parser.parse_args()
+
+    pages = [open(fpath, encoding="utf-8").read() for fpath in args.html] if args.html else [synthetic_page(n_players=args.players)]
+    tables = list()
+    for html in pages:
+        soup = BeautifulSoup(uncomment_tables(html), "lxml")
+        tables += [table for table in soup.find_all("table", id=True) if table.find("thead") is not None]
+    print(f"{len(tables)} tables from {len(pages)} page(s), {args.repeat} repeats")
+
+    mismatches = [table["id"] for table in tables if not compare(pd.read_html(io.StringIO(str(table)))[0], decode_table(table))]
+    print(f"Mismatched tables: {mismatches if mismatches else 'none'}")
+
+    for name, decode in [("pd.read_html(str(tag))", lambda table: pd.read_html(io.StringIO(str(table)))[0]), ("decode_table(tag)", decode_table)]:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for table in tables:
+                decode(table)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<24} {elapsed:.3f}s total, {elapsed / (args.repeat * len(tables)) * 1000:.2f}ms per table")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,10 @@ from selenium.webdriver.remote.webelement import WebElement
 import time
 from bs4 import BeautifulSoup
 
-from .request_utils import get_proxy, HEADERS, get_request
+from .request_utils import get_proxy, HEADERS, get_request, get_proxy_pool
+from . import rate_limit
+from .replay import REPLAY
+from .metrics import METRICS
 from utils import get_system_usage
 import json
 import os
@@ -22,6 +25,10 @@ class WhoScored:
 
     ############################################################################
     def __init__(self):
+        if REPLAY.mode == "replay":  # pages come from the archive, no browser or proxy needed
+            self.driver = None
+            self.proxy = None
+            return
         # # whoscored scraper CANNOT be headless
         # options.add_argument("window-size=700,600")
         proxy = get_proxy()  # Use proxy
@@ -40,10 +47,12 @@ class WhoScored:
         options.set_preference("permissions.default.image", 2)
         options.page_load_strategy = "eager"
         options.set_preference("dom.ipc.plugins.enabled.libflashplayer.so", "false")
+        self.proxy = proxy
         try:
             self.driver = webdriver.Firefox(options=options)
         except Exception as e:
             print("Error starting webdriver. Trying again.")
+            get_proxy_pool().report(self.proxy, ok=False)
             proxy = get_proxy()  # Use proxy
             # proxy = {"http": "185.222.115.104:31280", "https": "185.222.115.104:31280"}
             proxy = proxy["https"]
@@ -54,18 +63,31 @@ class WhoScored:
             options.set_preference("network.proxy.ssl", ip)
             options.set_preference("network.proxy.ssl_port", int(port))
 
+            self.proxy = proxy
             self.driver = webdriver.Firefox(options=options)
 
     ############################################################################
     def close(self):
+        if self.driver is None:
+            return
         self.driver.close()
         self.driver.quit()
 
     def get(self, link):
+        """Loads link in the browser and returns the page source (read from the archive in replay mode)."""
+        if REPLAY.mode == "replay":
+            return REPLAY.load_text("browser", link)
         try:
+            rate_limit.acquire(link)
+            start = time.time()
             self.driver.get(link)
+            get_proxy_pool().report(self.proxy, ok=True, latency=time.time() - start)
             # Click the cookies button
             self.click_cookie_button()
+            source = self.driver.page_source
+            METRICS.record_request(link, "browser", time.time() - start, len(source), source="browser")
+            if REPLAY.mode == "record":
+                REPLAY.record("browser", link, source.encode(), encoding="utf-8", elapsed=time.time() - start)
 
             # Check ram usage
             system_usage = get_system_usage()
@@ -74,7 +96,10 @@ class WhoScored:
                 print(f"RAM free is {ram_amt_free}. Restarting webdriver.")
                 self.close()
                 self.__init__()
+            return source
         except selenium.common.exceptions.TimeoutException:
+            METRICS.record_request(link, "TimeoutException", time.time() - start, source="browser")
+            get_proxy_pool().report(self.proxy, ok=False)
             print("Timeout exception. Reinitializing webdriver.")
             self.close()
             self.__init__()
@@ -161,6 +186,11 @@ class WhoScored:
 
     ############################################################################
     def get_match_links(self, year, league):
+        # the season pages are navigated by clicking through them, so only the resulting link list can be replayed
+        replay_key = f"{league}/{year}"
+        if REPLAY.mode == "replay":
+            links = REPLAY.load_text("links", replay_key)
+            return json.loads(links) if links is not None else -1
 
         # Go to season page
         season_link = self.get_season_link(year, league)
@@ -225,7 +255,10 @@ class WhoScored:
                 if initial == self.driver.page_source:  # if the page didn't change, then we've reached the end
                     break
         # print(list(set(links)))
-        return list(set(links))
+        links = list(set(links))
+        if REPLAY.mode == "record":
+            REPLAY.record("links", replay_key, json.dumps(links).encode(), encoding="utf-8")
+        return links
 
     def scrape_matches(self, year, league, path):
 
@@ -242,7 +275,6 @@ class WhoScored:
         # Scrape match data for each link
         i = 0
         for link in tqdm(match_data, desc=f"Scraping {league} {year - 1}-{year} matches", total=len(match_data)):
-            time.sleep(3)
             i += 1
             try_count = 0
             while match_data[link] == "":
@@ -269,11 +301,11 @@ class WhoScored:
 
     ############################################################################
     def scrape_match(self, link):
-        self.get(link)
+        source = self.get(link)
         scripts = list()
 
-        for el in self.driver.find_elements(By.TAG_NAME, "script"):
-            scripts.append(el.get_attribute("innerHTML"))
+        for el in BeautifulSoup(source, "html.parser").find_all("script"):
+            scripts.append(el.get_text())
 
         for script in scripts:
             if 'require.config.params["args"]' in script:
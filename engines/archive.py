@@ -0,0 +1,126 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+try:
+    import zstandard
+except ImportError:  # optional, pages are gzipped without it
+    zstandard = None
+
+ARCHIVE_DIR = "data/archive"
+ARCHIVE_MODES = ["off", "on", "only"]  # "only" serves every page from the archive and never hits the network
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    content_hash TEXT NOT NULL,
+    encoding TEXT
+);
+CREATE INDEX IF NOT EXISTS pages_url ON pages (kind, url, fetched_at);
+"""
+
+
+class PageArchive:
+    """Permanent, content-deduplicated archive of every fetched page.
+
+    Page bodies are stored once per distinct content as blobs/<sha256[:2]>/<sha256>.zst (or .gz without the zstandard
+    package). A SQLite index holds one row per (kind, url) version with its fetch time, so refetching an unchanged page
+    costs nothing and `load()` returns the latest version. Kinds are "http" for get_request and "browser" for WebDriver
+    page sources. Only pages fetched over the network are stored, HTTP cache hits are not.
+
+    Unlike the HTTP cache (bounded, evicts old entries) and the replay archive (an opt-in snapshot of one run with
+    statuses, headers and timings, overwritten per URL), this keeps every version of every page for good, so any
+    season can be reparsed after a parser change.
+    """
+
+    def __init__(self, path: str = ARCHIVE_DIR, mode: str = "on"):
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.conn = None  # opened lazily
+
+    def _connect(self) -> sqlite3.Connection:
+        # callers hold self.lock
+        if self.conn is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.conn = sqlite3.connect(os.path.join(self.path, "index.sqlite3"), timeout=60, check_same_thread=False)
+            self.conn.executescript(SCHEMA)
+        return self.conn
+
+    def _blob_fpath(self, content_hash: str, ext: str) -> str:
+        return os.path.join(self.path, "blobs", content_hash[:2], f"{content_hash}.{ext}")
+
+    def store(self, kind: str, url: str, body: bytes, encoding: str = None, fetched_at: float = None):
+        content_hash = hashlib.sha256(body).hexdigest()
+        ext = "zst" if zstandard is not None else "gz"
+        fpath = self._blob_fpath(content_hash, ext)
+        if not os.path.exists(fpath):
+            os.makedirs(os.path.dirname(fpath), exist_ok=True)
+            tmp_fpath = f"{fpath}.{threading.get_ident()}.tmp"
+            compressed = zstandard.ZstdCompressor(level=10).compress(body) if ext == "zst" else gzip.compress(body)
+            with open(tmp_fpath, "wb") as f:
+                f.write(compressed)
+            os.replace(tmp_fpath, fpath)
+        with self.lock:
+            conn = self._connect()
+            latest = conn.execute("SELECT content_hash FROM pages WHERE kind = ? AND url = ? ORDER BY fetched_at DESC LIMIT 1", (kind, url)).fetchone()
+            if latest is not None and latest[0] == content_hash:
+                return  # unchanged since the last fetch
+            with conn:
+                conn.execute("INSERT INTO pages VALUES (?, ?, ?, ?, ?)", (kind, url, fetched_at or time.time(), content_hash, encoding))
+
+    def load(self, kind: str, url: str) -> dict:
+        """Returns the latest archived version of url ("body", "encoding", "fetched_at"), or None."""
+        with self.lock:
+            row = self._connect().execute("SELECT content_hash, encoding, fetched_at FROM pages WHERE kind = ? AND url = ? ORDER BY fetched_at DESC LIMIT 1", (kind, url)).fetchone()
+        if row is None:
+            print(f"{kind} {url} is not in the page archive at {self.path}")
+            return None
+        content_hash, encoding, fetched_at = row
+        for ext in ["zst", "gz"]:
+            fpath = self._blob_fpath(content_hash, ext)
+            if os.path.exists(fpath):
+                with open(fpath, "rb") as f:
+                    compressed = f.read()
+                if ext == "zst" and zstandard is None:
+                    raise ImportError(f"zstandard is required to read {fpath}")
+                body = zstandard.ZstdDecompressor().decompress(compressed) if ext == "zst" else gzip.decompress(compressed)
+                return {"body": body, "encoding": encoding, "fetched_at": fetched_at}
+        print(f"Archived page {kind} {url} is missing its blob {content_hash}")
+        return None
+
+    def load_text(self, kind: str, url: str) -> str:
+        entry = self.load(kind, url)
+        return entry["body"].decode(entry.get("encoding") or "utf-8") if entry is not None else None
+
+    def to_response(self, url: str, entry: dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = url
+        response._content = entry["body"]
+        response.encoding = entry.get("encoding")
+        return response
+
+
+ARCHIVE = PageArchive()
+
+
+def configure_archive(mode: str = None, path: str = None):
+    if mode is not None:
+        if mode not in ARCHIVE_MODES:
+            raise ValueError(f"Invalid archive mode {mode}. Must be one of {ARCHIVE_MODES}")
+        ARCHIVE.mode = mode
+    if path is not None:
+        with ARCHIVE.lock:
+            if ARCHIVE.conn is not None:
+                ARCHIVE.conn.close()
+                ARCHIVE.conn = None
+            ARCHIVE.path = path
@@ -0,0 +1,157 @@
+import atexit
+import threading
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+from webdriver_manager.chrome import ChromeDriverManager
+
+DRIVER_POOL_SIZE = 1  # warm spare browsers kept ready
+DRIVER_PAGE_BUDGET = 200  # pages a browser loads before it is recycled, Chrome's memory use creeps up over time
+PAGE_LOAD_TIMEOUT = 120000
+
+_CHROMEDRIVER_PATH = None
+_CHROMEDRIVER_LOCK = threading.Lock()
+
+
+def chromedriver_path() -> str:
+    """Resolves (and downloads if needed) the chromedriver binary once per process."""
+    global _CHROMEDRIVER_PATH
+    with _CHROMEDRIVER_LOCK:
+        if _CHROMEDRIVER_PATH is None:
+            _CHROMEDRIVER_PATH = ChromeDriverManager().install()
+        return _CHROMEDRIVER_PATH
+
+
+def start_chrome(options) -> webdriver.Chrome:
+    driver = webdriver.Chrome(service=ChromeService(chromedriver_path()), options=options)
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    return driver
+
+
+def is_healthy(driver) -> bool:
+    try:
+        return driver.execute_script("return 1") == 1
+    except Exception:
+        return False
+
+
+def quit_driver(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+class DriverPool:
+    """Pre-warmed Chrome WebDrivers.
+
+    `acquire()` hands out a warm browser (starting one only if none is ready) and launches a replacement spare in the
+    background, so replacing a crashed or recycled browser is instant. Browsers go back with `release()`, which quits
+    them in the background once they are unhealthy or have loaded `page_budget` pages (counted with `note_page()`).
+    Broken browsers are thrown away with `discard()`.
+    """
+
+    def __init__(self, options, size: int = DRIVER_POOL_SIZE, page_budget: int = DRIVER_PAGE_BUDGET):
+        self.options = options
+        self.size = size
+        self.page_budget = page_budget
+        self.lock = threading.Lock()
+        self.idle = list()
+        self.pages = dict()  # id(driver) -> pages loaded
+        self.warming = 0
+        self.closed = False
+
+    def _warm(self):
+        try:
+            driver = start_chrome(self.options)
+        except Exception as e:
+            print(f"Failed to start a spare Chrome: {e}")
+            driver = None
+        with self.lock:
+            self.warming -= 1
+            if driver is not None and not self.closed:
+                self.pages[id(driver)] = 0
+                self.idle.append(driver)
+                driver = None
+        if driver is not None:  # the pool was closed while it started
+            quit_driver(driver)
+
+    def _top_up(self):
+        # callers hold self.lock
+        while not self.closed and len(self.idle) + self.warming < self.size:
+            self.warming += 1
+            threading.Thread(target=self._warm, daemon=True).start()
+
+    def acquire(self) -> webdriver.Chrome:
+        while True:
+            with self.lock:
+                driver = self.idle.pop() if self.idle else None
+                self._top_up()
+            if driver is None:
+                driver = start_chrome(self.options)
+                with self.lock:
+                    self.pages[id(driver)] = 0
+                return driver
+            if is_healthy(driver):
+                return driver
+            self.discard(driver)
+
+    def note_page(self, driver):
+        with self.lock:
+            self.pages[id(driver)] = self.pages.get(id(driver), 0) + 1
+
+    def exhausted(self, driver) -> bool:
+        """True once the driver has used up its page budget."""
+        with self.lock:
+            return self.pages.get(id(driver), 0) >= self.page_budget
+
+    def release(self, driver):
+        if self.closed or self.exhausted(driver) or not is_healthy(driver):
+            self.discard(driver)
+            return
+        with self.lock:
+            self.idle.append(driver)
+
+    def discard(self, driver):
+        with self.lock:
+            self.pages.pop(id(driver), None)
+            self._top_up()
+        threading.Thread(target=quit_driver, args=(driver,), daemon=True).start()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            idle, self.idle = self.idle, list()
+        for driver in idle:
+            quit_driver(driver)
+
+
+_POOLS = dict()
+_POOLS_LOCK = threading.Lock()
+_POOL_SETTINGS = {"size": DRIVER_POOL_SIZE, "page_budget": DRIVER_PAGE_BUDGET}
+
+
+def get_driver_pool(name: str, options) -> DriverPool:
+    """Returns the pool named `name` (one per scraper type), creating it with `options` on first use."""
+    with _POOLS_LOCK:
+        if not _POOLS:
+            atexit.register(close_driver_pools)
+        if name not in _POOLS:
+            _POOLS[name] = DriverPool(options, **_POOL_SETTINGS)
+        return _POOLS[name]
+
+
+def configure_driver_pools(size: int = None, page_budget: int = None):
+    with _POOLS_LOCK:
+        for key, value in [("size", size), ("page_budget", page_budget)]:
+            if value is not None:
+                _POOL_SETTINGS[key] = value
+                for pool in _POOLS.values():
+                    setattr(pool, key, value)
+
+
+def close_driver_pools():
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    for pool in pools:
+        pool.close()
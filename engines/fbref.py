@@ -3,29 +3,95 @@
 import numpy as np
 import pandas as pd
 from ScraperFC.shared_functions import xpath_soup, sources
-from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.service import Service as ChromeService
 from bs4 import BeautifulSoup
 import time
 import re
 import os
+import asyncio
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
 from .request_utils import get_request
+from .driver_pool import get_driver_pool
+from . import rate_limit
+from .replay import REPLAY
+from .archive import ARCHIVE
+from .metrics import METRICS, PipelineStats
+from .season_catalog import SEASON_CATALOG
+from .ledger import LEDGER
+from .fbref_tables import uncomment_tables, per90, index_match_page, decode_table, flatten_columns, MatchBatch
 from tqdm import tqdm
 
 MAX_WORKERS = 20
-LINKS_CACHE_FPATH = "data/cache/fbref_links.txt"
+PARSE_WORKERS = os.cpu_count() or 1
+
+
+_PARSE_POOL = None
+_PARSE_POOL_LOCK = threading.Lock()
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """The process pool of PARSE_WORKERS processes every match pipeline parses in, shared by all leagues.
+
+    Started on first use (and again if a worker died) with the forkserver start method where available, since the
+    pipelines run in league threads and forking a multithreaded process is unsafe.
+    """
+    global _PARSE_POOL
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is None or getattr(_PARSE_POOL, "_broken", False):
+            if _PARSE_POOL is None:
+                atexit.register(close_parse_pool)
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _PARSE_POOL = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=context)
+        return _PARSE_POOL
+
+
+def close_parse_pool():
+    global _PARSE_POOL
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is not None:
+            _PARSE_POOL.shutdown(cancel_futures=True)
+            _PARSE_POOL = None
+
+
+def configure_match_pipeline(fetch_workers: int = None, parse_workers: int = None):
+    """Sets the default number of fetchers of FBRef.fetch_matches() and the size of the shared parse pool."""
+    global MAX_WORKERS, PARSE_WORKERS
+    if fetch_workers:
+        MAX_WORKERS = fetch_workers
+    if parse_workers and parse_workers != PARSE_WORKERS:
+        PARSE_WORKERS = parse_workers
+        close_parse_pool()  # restarted with the new size on next use
+
+
+def _timed_parse(link, html):
+    # runs in the parse pool. Returns the parse time too, as time spent waiting for a busy pool is not parsing
+    start = time.time()
+    return FBRef.parse_match(link, html), time.time() - start
 
 
 class FBRef:
-    """ScraperFC module for FBRef"""
+    """ScraperFC module for FBRef
+
+    Instances are not thread safe, but they are isolated: each one holds its own browser from the driver pool and,\
+    with a session_scope, its own HTTP sessions, so concurrent workers should each create one (see for_league()). The\
+    fbref.com rate limit is global and shared by all of them.
+
+    Args
+    ----
+    session_scope : str
+        OPTIONAL, default is None (the process wide sessions). Name of the HTTP sessions this instance uses.
+    """
 
     ####################################################################################################################
-    def __init__(self):
-        self.wait_time = 6  # in seconds, as of 30-Oct-2022 FBRef blocks if requesting more than 20 requests/minute
+    def __init__(self, session_scope=None):
+        self.wait_time = 6  # in seconds, request timeout. Pacing between requests is handled by rate_limit.RATE_LIMITS
+        self.session_scope = session_scope
 
         options = Options()
         options.headless = True
@@ -46,9 +112,8 @@ class FBRef:
         prefs = {"profile.managed_default_content_settings.images": 2}  # don't load images
         options.add_experimental_option("prefs", prefs)
         options.add_argument("--log-level=3")
-        self.driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
         self.options = options
-        self.driver.set_page_load_timeout(120000)
+        self._driver = None  # taken from the driver pool on first use, replays never need a browser
 
         self.stats_categories = {
             "standard": {
@@ -97,18 +162,52 @@ class FBRef:
             },
         }
 
+    ####################################################################################################################
+    @classmethod
+    def for_league(cls, league):
+        """ Scraper factory for per-league workers.
+
+        Args
+        ----
+        league : str
+            League the worker scrapes, used as its session scope
+        Returns
+        -------
+        : FBRef
+            A scraper with its own browser and HTTP sessions. Call close()\
+            when the worker is done so its browser goes back to the pool.
+        """
+        return cls(session_scope=f"fbref:{league}")
+
+    ####################################################################################################################
+    @property
+    def driver(self):
+        """The Selenium WebDriver instance, taken from the warm driver pool on first access."""
+        if self._driver is None:
+            self._driver = get_driver_pool("fbref", self.options).acquire()
+        return self._driver
+
     ####################################################################################################################
     def close(self):
-        """Closes and quits the Selenium WebDriver instance."""
-        self.driver.close()
-        self.driver.quit()
+        """Returns the Selenium WebDriver instance to the driver pool."""
+        if self._driver is not None:
+            get_driver_pool("fbref", self.options).release(self._driver)
+            self._driver = None
+
+    ####################################################################################################################
+    def reset_driver(self):
+        """Throws away a broken WebDriver instance. The next access takes a warm one from the driver pool."""
+        if self._driver is not None:
+            get_driver_pool("fbref", self.options).discard(self._driver)
+            self._driver = None
 
     ####################################################################################################################
     def get(self, url):
         """ Custom get function just for the FBRef module. 
         
-        Calls .get() from the Selenium WebDriver and then waits in order to\
-        avoid a Too Many Requests HTTPError from FBRef. 
+        Waits for the shared fbref.com rate limit and then calls .get() from\
+        the Selenium WebDriver, in order to avoid a Too Many Requests HTTPError\
+        from FBRef. In replay mode the recorded page source is returned instead.
         
         Args
         ----
@@ -116,17 +215,59 @@ class FBRef:
             The URL to get
         Returns
         -------
-        None
+        : str
+            The page source
         """
+        if REPLAY.mode == "replay":
+            return REPLAY.load_text("browser", url)
+        if ARCHIVE.mode == "only":
+            return ARCHIVE.load_text("browser", url)
+
+        pool = get_driver_pool("fbref", self.options)
+        if self._driver is not None and pool.exhausted(self._driver):
+            self.close()  # page budget used up, the pool recycles the browser and we take a warm one
+
+        rate_limit.acquire(url)
+        start = time.time()
         try:
             self.driver.get(url)
         except Exception as E:
-            self.driver.close()
-            self.driver.quit()
-            self.driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=self.options)
-            self.driver.set_page_load_timeout(120000)
-            self.get(url)
-        time.sleep(self.wait_time)
+            self.reset_driver()
+            return self.get(url)
+        pool.note_page(self._driver)
+        return self.page_source(url, start)
+
+    ####################################################################################################################
+    def page_source(self, key, start=None):
+        """ Returns the WebDriver's current page source.
+
+        In record mode the source is archived under `key` (the URL, plus a\
+        suffix for pages that were interacted with), in replay mode it is\
+        read back from the archive.
+
+        Args
+        ----
+        key : str
+            Archive key of the page
+        start : float
+            OPTIONAL, time.time() when the page started loading, for the\
+            archive's timing metadata
+        Returns
+        -------
+        : str
+            The page source
+        """
+        if REPLAY.mode == "replay":
+            return REPLAY.load_text("browser", key)
+        if ARCHIVE.mode == "only":
+            return ARCHIVE.load_text("browser", key)
+        source = self.driver.page_source
+        METRICS.record_request(key, "browser", time.time() - start if start else 0.0, len(source), source="browser")
+        if REPLAY.mode == "record":
+            REPLAY.record("browser", key, source.encode(), encoding="utf-8", elapsed=time.time() - start if start else None)
+        if ARCHIVE.mode == "on":
+            ARCHIVE.store("browser", key, source.encode(), encoding="utf-8")
+        return source
 
     ####################################################################################################################
     def requests_get(self, url):
@@ -143,12 +284,15 @@ class FBRef:
         : requests.Response
             The response
         """
-        response = get_request(url, timeout=self.wait_time)
+        response = get_request(url, timeout=self.wait_time, session_scope=self.session_scope)
         return response
 
     ####################################################################################################################
-    def get_season_link(self, year, league):
-        """ Returns the URL for the chosen league season.
+    def get_season_urls(self, year, league):
+        """ Returns the season, fixtures and stats category URLs for the chosen league season.
+
+        Served from the season catalog. On a miss, the league's history page is fetched once and every season listed on
+        it is added to the catalog.
 
         Args
         ----
@@ -160,35 +304,41 @@ class FBRef:
             each module.
         Returns
         -------
-        : str
-            URL to the FBRef page of the chosen league season 
+        : dict
+            "season", "fixtures" and "stats" (stats category name to URL) URLs, or None if the season is not found
         """
+        entry = SEASON_CATALOG.get(league, year)
+        if entry is not None:
+            return entry
 
         url = sources["FBRef"][league]["url"]
         finder = sources["FBRef"][league]["finder"]
 
         # go to the league's history page
         response = self.requests_get(url)
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        calendar_years = [
-            str(year - 1) + "-" + str(year),
-            str(year),
-        ]  # list of 1- and 2-calendar years strings to work for any competition
+        if response is None:
+            print(f"Could not get the {league} history page {url}.")
+            return None
+        soup = BeautifulSoup(response.content, "lxml")
 
-        # Get url to season
+        # Get urls to all seasons, keyed by the calendar year the season ends in. Works for 1- and 2-calendar year
+        # seasons (e.g. "2023" and "2022-2023")
+        seasons = dict()
         for tag in soup.find_all("th", {"data-stat": ["year", "year_id"]}):
+            season_year = tag.getText().split("-")[-1]
             finder_found = np.any([f in tag.find("a")["href"] for f in finder if tag.find("a")])  # bool, if any finders are found in tag
-            season_found = np.any([tag.getText() == s for s in calendar_years])  # bool, if 1- or 2-calendar years are found in tag
-            if tag.find("a") and finder_found and season_found:
-                return "https://fbref.com" + tag.find("a")["href"]
+            if tag.find("a") and finder_found and season_year.isdecimal() and int(season_year) not in seasons:
+                seasons[int(season_year)] = "https://fbref.com" + tag.find("a")["href"]
+        SEASON_CATALOG.update(league, seasons, {category: value["url"] for category, value in self.stats_categories.items()})
 
-        print(f"No {league} {year} season is available on FBRef.")
-        return -1  # if season URL is not found
+        entry = SEASON_CATALOG.get(league, year)
+        if entry is None:
+            print(f"No {league} {year} season is available on FBRef.")
+        return entry
 
     ####################################################################################################################
-    def get_match_links(self, year, league):
-        """ Gets all match links for the chosen league season.
+    def get_season_link(self, year, league):
+        """ Returns the URL for the chosen league season.
 
         Args
         ----
@@ -200,38 +350,94 @@ class FBRef:
             each module.
         Returns
         -------
-        : list
-            FBRef links to all matches for the chosen league season
+        : str
+            URL to the FBRef page of the chosen league season 
+        """
+        entry = self.get_season_urls(year, league)
+        return entry["season"] if entry is not None else -1  # if season URL is not found
+
+    ####################################################################################################################
+    def get_fixtures(self, year, league):
+        """ Gets the played matches of the chosen league season from its scores and fixtures page.
+
+        Args
+        ----
+        year : int
+            Calendar year that the season ends in (e.g. 2023 for the 2022/23\
+            season)
+        league : str
+            League. Look in shared_functions.py for the available leagues for\
+            each module.
+        Returns
+        -------
+        : Pandas DataFrame
+            One row per played match with its "Date" (datetime.date), "Home Team ID", "Away Team ID" and match report\
+            "Link". None if the season or its played matches are not found.
         """
 
-        season_link = self.get_season_link(year, league)
-        if season_link == -1:
+        season_urls = self.get_season_urls(year, league)
+        if season_urls is None:
             return None
 
         # go to the scores and fixtures page
-        split = season_link.split("/")
-        first_half = "/".join(split[:-1])
-        second_half = split[-1].split("-")
-        second_half = "-".join(second_half[:-1]) + "-Score-and-Fixtures"
-        fixtures_url = first_half + "/schedule/" + second_half
+        fixtures_url = season_urls["fixtures"]
         response = self.requests_get(fixtures_url)
-        soup = BeautifulSoup(response.content, "html.parser")
+        if response is None:
+            print(f"Could not get the {league} {year} fixtures page {fixtures_url}.")
+            return None
+        soup = BeautifulSoup(response.content, "lxml")
+
+        # played matches are the rows with a link on the score. Only keep those that have the sources finder
+        finders = sources["FBRef"][league]["finder"]
+        fixtures = list()
+        for score in soup.find_all("td", {"data-stat": "score"}):
+            link = score.find(href=True)
+            if link is None or not np.any([f in link["href"] for f in finders]):
+                continue
+            row = score.find_parent("tr")
+            date = row.find("td", {"data-stat": "date"})
+            teams = [row.find("td", {"data-stat": stat}) for stat in ["home_team", "away_team"]]
+            team_ids = [team.find("a")["href"].split("/")[3] if team is not None and team.find("a") else None for team in teams]
+            fixtures.append(
+                {
+                    "Date": datetime.strptime(date.getText().strip(), "%Y-%m-%d").date() if date is not None and date.getText().strip() else None,
+                    "Home Team ID": team_ids[0],
+                    "Away Team ID": team_ids[1],
+                    "Link": "https://fbref.com" + link["href"],
+                }
+            )
 
         # check if there are any scores elements with links. if not, no match links are present
-        scores_links = [t.find(href=True) for t in soup.find_all("td", {"data-stat": "score"}) if t.find(href=True)]
-        if len(scores_links) == 0:
+        if len(fixtures) == 0:
             print(f"No match score elements with links found at {fixtures_url} for {league} {year}.")
             return None
 
-        # find all of the match links from the scores and fixtures page that have the sources finder
-        finders = sources["FBRef"][league]["finder"]
-        match_links = ["https://fbref.com" + t["href"] for t in scores_links if t and np.any([f in t["href"] for f in finders])]
+        return pd.DataFrame(fixtures).drop_duplicates(subset="Link", ignore_index=True)
+
+    ####################################################################################################################
+    def get_match_links(self, year, league):
+        """ Gets all match links for the chosen league season that are not in the scrape ledger yet.
+
+        Args
+        ----
+        year : int
+            Calendar year that the season ends in (e.g. 2023 for the 2022/23\
+            season)
+        league : str
+            League. Look in shared_functions.py for the available leagues for\
+            each module.
+        Returns
+        -------
+        : list
+            FBRef links to all matches for the chosen league season
+        """
+        fixtures = self.get_fixtures(year, league)
+        if fixtures is None:
+            return None
 
-        match_links = list(set(match_links))
-        if os.path.exists(LINKS_CACHE_FPATH):
-            with open(LINKS_CACHE_FPATH, "r") as f:
-                cached_links = f.read().split("\n")
-            match_links = [x for x in match_links if x not in cached_links]
+        if ARCHIVE.mode == "only":
+            return fixtures["Link"].tolist()  # reparsing everything
+        match_links = LEDGER.filter_new(fixtures["Link"])  # skip matches scraped in earlier runs
 
         return match_links
 
@@ -264,54 +470,69 @@ class FBRef:
             raise Exception(f'"{stat_category}" is not a valid FBRef stats category. ' + f"Must be one of {list(self.stats_categories.keys())}.")
 
         # Get URL to stat category
-        season_url = self.get_season_link(year, league)
-        old_suffix = season_url.split("/")[-1]
-        new_suffix = f'{self.stats_categories[stat_category]["url"]}/{old_suffix}'
-        new_url = season_url.replace(old_suffix, new_suffix)
-
-        self.get(new_url)  # webdrive to link
-        soup = BeautifulSoup(self.driver.page_source, "html.parser")  # get initial soup
-
-        # Normalize button, if requested
-        if normalize:
-            # click all per90 toggles on the page
-            per90_toggles = soup.find_all("button", {"id": re.compile("per_match_toggle")})
-            for toggle in per90_toggles:
-                xpath = xpath_soup(toggle)
-                button_el = self.driver.find_element(By.XPATH, xpath)
-                self.driver.execute_script("arguments[0].click()", button_el)
-            # update the soup
-            soup = BeautifulSoup(self.driver.page_source, "html.parser")
-
-        # Gather stats table tags
-        squad_stats_tag = soup.find("table", {"id": re.compile("for")})
-        opponent_stats_tag = soup.find("table", {"id": re.compile("against")})
-        player_stats_tag = soup.find(
-            "table",
-            {"id": re.compile(f'stats_{self.stats_categories[stat_category]["html"]}')},
-        )
-
-        # Get stats dataframes
-        squad_stats = pd.read_html(str(squad_stats_tag))[0] if squad_stats_tag is not None else None
-        opponent_stats = pd.read_html(str(opponent_stats_tag))[0] if opponent_stats_tag is not None else None
-        player_stats = pd.read_html(str(player_stats_tag))[0] if player_stats_tag is not None else None
-
-        # Drop rows that contain duplicated table headers
-        squad_stats = squad_stats[(~squad_stats[("Unnamed: 0_level_0", "Squad")].isna()) & (squad_stats[("Unnamed: 0_level_0", "Squad")] != "Squad")].reset_index(drop=True)
-        opponent_stats = opponent_stats[(~opponent_stats[("Unnamed: 0_level_0", "Squad")].isna()) & (opponent_stats[("Unnamed: 0_level_0", "Squad")] != "Squad")].reset_index(drop=True)
-        player_stats = player_stats[player_stats[("Unnamed: 0_level_0", "Rk")] != "Rk"].reset_index(drop=True)
-
-        # Add team ID's
-        if squad_stats is not None:
-            squad_stats["Team ID"] = [tag.find("a")["href"].split("/")[3] for tag in squad_stats_tag.find_all("th", {"data-stat": "team"})[1:] if tag and tag.find("a")]
-        if opponent_stats is not None:
-            opponent_stats["Team ID"] = [tag.find("a")["href"].split("/")[3] for tag in opponent_stats_tag.find_all("th", {"data-stat": "team"})[1:] if tag and tag.find("a")]
-
-        # Add player links and ID's
-        if player_stats is not None:
-            player_links = ["https://fbref.com" + tag.find("a")["href"] for tag in player_stats_tag.find_all("td", {"data-stat": "player"}) if tag and tag.find("a")]
-            player_stats["Player Link"] = player_links
-            player_stats["Player ID"] = [l.split("/")[-2] for l in player_links]
+        season_urls = self.get_season_urls(year, league)
+        if season_urls is None:
+            raise Exception(f"No {league} {year} season found on FBRef.")
+        new_url = season_urls["stats"][stat_category]
+
+        # Most tables are hidden in HTML comments, unwrapping them gets everything without a browser
+        response = self.requests_get(new_url)
+        soup = BeautifulSoup(uncomment_tables(response.text), "html.parser") if response is not None else None
+        use_browser = soup is None or any(soup.find("table", {"id": re.compile(table_id)}) is None for table_id in ["for", "against", f'stats_{self.stats_categories[stat_category]["html"]}'])
+
+        if use_browser:
+            print(f"Stats tables not found in the HTML of {new_url}, falling back to the browser.")
+            soup = BeautifulSoup(self.get(new_url), "html.parser")  # webdrive to link and get initial soup
+
+            # Normalize button, if requested
+            if normalize:
+                # click all per90 toggles on the page
+                start = time.time()
+                if REPLAY.mode != "replay" and ARCHIVE.mode != "only":
+                    per90_toggles = soup.find_all("button", {"id": re.compile("per_match_toggle")})
+                    for toggle in per90_toggles:
+                        xpath = xpath_soup(toggle)
+                        button_el = self.driver.find_element(By.XPATH, xpath)
+                        self.driver.execute_script("arguments[0].click()", button_el)
+                # update the soup
+                soup = BeautifulSoup(self.page_source(new_url + "#per90", start), "html.parser")
+
+        with METRICS.timer("parse_stats"):
+            # Gather stats table tags
+            squad_stats_tag = soup.find("table", {"id": re.compile("for")})
+            opponent_stats_tag = soup.find("table", {"id": re.compile("against")})
+            player_stats_tag = soup.find(
+                "table",
+                {"id": re.compile(f'stats_{self.stats_categories[stat_category]["html"]}')},
+            )
+
+            # Get stats dataframes
+            squad_stats = decode_table(squad_stats_tag) if squad_stats_tag is not None else None
+            opponent_stats = decode_table(opponent_stats_tag) if opponent_stats_tag is not None else None
+            player_stats = decode_table(player_stats_tag) if player_stats_tag is not None else None
+
+            # Drop rows that contain duplicated table headers
+            squad_stats = squad_stats[(~squad_stats[("Unnamed: 0_level_0", "Squad")].isna()) & (squad_stats[("Unnamed: 0_level_0", "Squad")] != "Squad")].reset_index(drop=True)
+            opponent_stats = opponent_stats[(~opponent_stats[("Unnamed: 0_level_0", "Squad")].isna()) & (opponent_stats[("Unnamed: 0_level_0", "Squad")] != "Squad")].reset_index(drop=True)
+            player_stats = player_stats[player_stats[("Unnamed: 0_level_0", "Rk")] != "Rk"].reset_index(drop=True)
+
+            # Add team ID's
+            if squad_stats is not None:
+                squad_stats["Team ID"] = [tag.find("a")["href"].split("/")[3] for tag in squad_stats_tag.find_all("th", {"data-stat": "team"})[1:] if tag and tag.find("a")]
+            if opponent_stats is not None:
+                opponent_stats["Team ID"] = [tag.find("a")["href"].split("/")[3] for tag in opponent_stats_tag.find_all("th", {"data-stat": "team"})[1:] if tag and tag.find("a")]
+
+            # Add player links and ID's
+            if player_stats is not None:
+                player_links = ["https://fbref.com" + tag.find("a")["href"] for tag in player_stats_tag.find_all("td", {"data-stat": "player"}) if tag and tag.find("a")]
+                player_stats["Player Link"] = player_links
+                player_stats["Player ID"] = [l.split("/")[-2] for l in player_links]
+
+            # Normalize locally, the browser path already clicked the per 90 toggles
+            if normalize and not use_browser:
+                squad_stats = per90(squad_stats)
+                opponent_stats = per90(opponent_stats)
+                player_stats = per90(player_stats)
 
         return squad_stats, opponent_stats, player_stats
 
@@ -351,7 +572,7 @@ class FBRef:
         """ Scrapes the FBRef standard stats page of the chosen league season.
             
         Works by gathering all of the match URL's from the homepage of the\
-        chosen league season on FBRef and then calling scrape_match() on each one.
+        chosen league season on FBRef and then fetching and parsing them concurrently with fetch_matches().
 
         Args
         ----
@@ -363,55 +584,201 @@ class FBRef:
             each module.
         Returns
         -------
-        : Pandas DataFrame
-            If save is False, will return the Pandas DataFrame with the the stats. 
+        : dict
+            The "matches", "players", "keepers" and "shots" tables of every\
+            scraped match (see scrape_match()), concatenated. Matches are\
+            sorted by date.
+        """
+        batch = MatchBatch()  # each table is concatenated once, not per match
+        for match in self.iter_matches(year, league):
+            batch.append(match)
+
+        return batch.to_frames()
+
+    ####################################################################################################################
+    def iter_matches(self, year, league, max_in_flight=None, links=None, parse_workers=None, buffer_size=None):
+        """ Yields the matches of the chosen league season as they are scraped.
+
+        Runs fetch_matches() on a private event loop in a background thread, which keeps fetching and parsing into a\
+        bounded buffer while the caller works on the matches it already got. Once the buffer is full the pipeline waits\
+        for the caller. Matches come in completion order, not by date. In archive only mode the pages come from the\
+        page archive, so the same pipeline reparses a season without any network request.
+
+        Args
+        ----
+        year : int
+            Calendar year that the season ends in (e.g. 2023 for the 2022/23\
+            season)
+        league : str
+            League. Look in shared_functions.py for the available leagues for\
+            each module.
+        max_in_flight : int
+            OPTIONAL, default is None (MAX_WORKERS). Maximum number of concurrent requests.
+        links : list
+            OPTIONAL, default is None. Match links to scrape instead of the ones from get_match_links().
+        parse_workers : int
+            OPTIONAL, default is None (PARSE_WORKERS). Maximum number of pages parsed at once in the shared parse pool.
+        buffer_size : int
+            OPTIONAL, default is None (MAX_WORKERS). Maximum number of parsed matches waiting for the caller.
+        Yields
+        ------
+        : dict
+            Flat tables of one match, see scrape_match()
         """
         season = str(year - 1) + "-" + str(year)
-        links = self.get_match_links(year, league)
-        matches = pd.DataFrame()  # initialize df
+        if links is None:
+            links = self.get_match_links(year, league)
+        if not links:
+            print(f"No new matches to scrape for {league} {season}.")
+            return
 
         # scrape match data
-        print(f"Scraping {len(links)} matches for {league} {season}.")
-        time.sleep(self.wait_time)
+        verb = "Reparsing" if ARCHIVE.mode == "only" else "Scraping"
+        print(f"{verb} {len(links)} matches for {league} {season}.")
+        loop = asyncio.new_event_loop()
+        done = object()  # end of the matches
+
+        async def new_buffer():
+            return asyncio.Queue(maxsize=buffer_size or MAX_WORKERS)
 
-        def fetch_and_concat(link):
+        async def drain():
+            matches = self.fetch_matches(links, max_in_flight, parse_workers, desc=f"{verb} {league} {season} matches")
             try:
-                match = self.scrape_match(link)
-                with open(LINKS_CACHE_FPATH, "a") as f:
-                    f.write(link + "\n")
-                return match
+                async for match in matches:
+                    await buffer.put(match)
+                await buffer.put(done)
+            except asyncio.CancelledError:
+                raise
             except Exception as E:
-                print(f"Failed scraping match {link}: {E}")
-                return pd.DataFrame()  # Return an empty DataFrame on failure
-
-        # with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        #     futures = {executor.submit(fetch_and_concat, link): link for link in links[:50]}
-
-        #     with tqdm(total=len(futures), desc=f"Scraping {league} {season} matches") as pbar:
-        #         for future in concurrent.futures.as_completed(futures):
-        #             try:
-        #                 match = future.result()
-        #                 matches = pd.concat([matches, match], ignore_index=True)
-        #             except Exception as E:
-        #                 print(f"Error in future for link {futures[future]}: {E}")
-        #             finally:
-        #                 pbar.update(1)
-        with tqdm(total=len(links), desc=f"Scraping {league} {season} matches") as pbar:
-            for link in links:
+                await buffer.put(E)
+            finally:
+                await matches.aclose()
+
+        async def stop():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        buffer = loop.run_until_complete(new_buffer())
+        task = loop.create_task(drain())
+        thread = threading.Thread(target=loop.run_forever, daemon=True)  # runs until the caller is done with the buffer
+        thread.start()
+        try:
+            while True:
+                match = asyncio.run_coroutine_threadsafe(buffer.get(), loop).result()
+                if match is done:
+                    break
+                if isinstance(match, Exception):
+                    raise match
+                yield match
+        finally:
+            # if the caller stopped early, stop the pipeline too
+            asyncio.run_coroutine_threadsafe(stop(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    ####################################################################################################################
+    async def fetch_matches(self, links, max_in_flight=None, parse_workers=None, queue_size=None, desc=None):
+        """ Fetches match pages concurrently and yields each one parsed as soon as it is ready.
+
+        A two stage pipeline. max_in_flight fetchers run requests in worker threads and push the raw pages into a\
+        bounded queue; parse_workers parsers take pages off the queue and run parse_match() in the process pool\
+        shared by every pipeline (see get_parse_pool()), so parsing uses every core without oversubscribing them when\
+        several leagues run at once, and never holds up the event loop. When the parsers fall behind the queue fills up and\
+        the fetchers wait, so memory stays bounded. The FBRef rate limit is shared by all fetchers. Every link is\
+        recorded in the scrape ledger.
+
+        Queue depth and the utilization of each stage are printed at the end and kept in METRICS: a stage near 100%\
+        is the bottleneck and needs more workers, a queue that stays full means parsing is the slower stage.
+
+        Args
+        ----
+        links : list
+            FBRef match links
+        max_in_flight : int
+            OPTIONAL, default is None (MAX_WORKERS). Number of fetchers, i.e. maximum number of concurrent requests.
+        parse_workers : int
+            OPTIONAL, default is None (PARSE_WORKERS). Maximum number of pages parsed at once in the shared parse pool.
+        queue_size : int
+            OPTIONAL, default is None (two pages per parser). Maximum number of fetched pages waiting to be parsed.
+        desc : str
+            OPTIONAL, progress bar description.
+        Yields
+        ------
+        : dict
+            Flat tables of one scraped match (see scrape_match()), in completion order. Failed matches are left out.
+        """
+        loop = asyncio.get_running_loop()
+        max_in_flight = min(max_in_flight or MAX_WORKERS, len(links))
+        parse_workers = min(parse_workers or PARSE_WORKERS, len(links))
+        pages = asyncio.Queue(maxsize=queue_size or 2 * parse_workers)
+        parsed = asyncio.Queue(maxsize=parse_workers)  # bounded too, so a caller that stops pulling pauses the pipeline
+        stats = PipelineStats({"fetch": max_in_flight, "parse": parse_workers})
+        remaining = iter(links)  # shared by the fetchers, so each link is fetched once
+
+        async def fetcher():
+            for link in remaining:
+                start = time.time()
                 try:
-                    match = fetch_and_concat(link)
-                    matches = pd.concat([matches, match], ignore_index=True)
+                    response = await loop.run_in_executor(fetch_executor, self.requests_get, link)
                 except Exception as E:
-                    print(f"Error scraping link {link}: {E}")
-                finally:
-                    pbar.update(1)
-                    time.sleep(self.wait_time)
-
-        # sort df by match date
-        if matches.shape[0] > 0:
-            matches = matches.sort_values(by="Date").reset_index(drop=True)
+                    response = E
+                stats.busy("fetch", time.time() - start)
+                await pages.put((link, response))
+                stats.sample_queue(pages.qsize())
+
+        async def parser():
+            while True:
+                link, response = await pages.get()
+                stats.sample_queue(pages.qsize())
+                if link is None:
+                    return
+                try:
+                    if response is None or isinstance(response, Exception):
+                        raise Exception(response or "no response")
+                    match, seconds = await loop.run_in_executor(get_parse_pool(), _timed_parse, link, response.content)
+                    stats.busy("parse", seconds)
+                    METRICS.record_stage("parse_match", seconds)
+                except Exception as E:
+                    match = E
+                await parsed.put((link, response, match))
 
-        return matches
+        async def run():
+            fetchers = [asyncio.ensure_future(fetcher()) for _ in range(max_in_flight)]
+            parsers = [asyncio.ensure_future(parser()) for _ in range(parse_workers)]
+            try:
+                await asyncio.gather(*fetchers)
+                for _ in parsers:
+                    await pages.put((None, None))
+                await asyncio.gather(*parsers)
+                await parsed.put((None, None, None))
+            finally:
+                for task in fetchers + parsers:
+                    task.cancel()
+                await asyncio.gather(*fetchers, *parsers, return_exceptions=True)
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as fetch_executor, tqdm(total=len(links), desc=desc) as pbar:
+            pipeline = asyncio.ensure_future(run())
+            try:
+                while True:
+                    link, response, match = await parsed.get()
+                    if link is None:
+                        break
+                    pbar.update(1)
+                    if isinstance(match, Exception):
+                        print(f"Failed scraping match {link}: {match}")
+                        if ARCHIVE.mode != "only":
+                            LEDGER.record(link, "failed")
+                        continue
+                    if ARCHIVE.mode != "only":
+                        LEDGER.record(link, "done", response.content)
+                    yield match
+            finally:
+                # if the caller stopped early, don't leave requests queued behind it
+                pipeline.cancel()
+                await asyncio.gather(pipeline, return_exceptions=True)
+                print(f"Match pipeline: {stats.report()}")
+                METRICS.record_pipeline(desc or "matches", stats.summary())
 
     ####################################################################################################################
     def scrape_match(self, link):
@@ -423,16 +790,45 @@ class FBRef:
             URL to the FBRef match page
         Returns
         -------
-        : Pandas DataFrame
-            DataFrame containing most parts of the match page if they're\
-            available (e.g. formations, lineups, scores, player stats, etc.).\
-            The fields that are available vary by competition and year.
+        : dict
+            Flat tables of the match, each keyed by the match "Link":\
+            "matches" (one row with teams, date, stage, formations, scores and\
+            expected stats), "players" (one row per player, with "Side" and\
+            "Team ID" columns and the summary, passing, pass types, defense,\
+            possession and misc stats side by side), "keepers" and "shots".\
+            Tables missing from the page are None. The fields that are\
+            available vary by competition and year.
         """
         response = self.requests_get(link)
-        soup = BeautifulSoup(response.content, "html.parser")
+        if response is None:
+            raise Exception(f"Could not get the match page {link}.")
+        with METRICS.timer("parse_match"):
+            return self.parse_match(link, response.content)
+
+    ####################################################################################################################
+    @staticmethod
+    def parse_match(link, html):
+        """ Parses the HTML of an FBRef match page.
+
+        Static, so that it can run in worker processes (see fetch_matches()).
+
+        Args
+        ----
+        link : str
+            URL to the FBRef match page
+        html : str or bytes
+            The page's HTML
+        Returns
+        -------
+        : dict
+            See scrape_match()
+        """
+        soup = BeautifulSoup(html, "lxml")
+        page = index_match_page(soup)  # every table, the scorebox, lineups, etc. in one pass over the document
+        tables = page["tables"]
 
         # Matchweek/stage ==============================================================================================
-        stage_el = list(soup.find("a", {"href": re.compile("-Stats")}, string=True).parents)[0]
+        stage_el = list(page["stage"].parents)[0]
         stage_text = stage_el.getText().split("(")[-1].split(")")[0].strip()
         if "matchweek" in stage_text:
             stage = int(stage_text.lower().replace("matchweek", "").strip())
@@ -440,66 +836,40 @@ class FBRef:
             stage = stage_text
 
         # Team names and ids ===========================================================================================
-        team_els = [el.find("a") for el in soup.find("div", {"class": "scorebox"}).find_all("strong") if el.find("a", href=True) is not None][:2]
+        team_els = [el.find("a") for el in page["scorebox"].find_all("strong") if el.find("a", href=True) is not None][:2]
         home_team_name = team_els[0].getText()
         home_team_id = team_els[0]["href"].split("/")[3]
         away_team_name = team_els[1].getText()
         away_team_id = team_els[1]["href"].split("/")[3]
 
         # Scores =======================================================================================================
-        scores = soup.find("div", {"class": "scorebox"}).find_all("div", {"class": "score"})
+        scores = page["scorebox"].find_all("div", {"class": "score"})
 
         # Formations ===================================================================================================
-        lineup_tags = [tag.find("table") for tag in soup.find_all("div", {"class": "lineup"})]
+        lineup_tags = page["lineups"]
 
         # Player stats =================================================================================================
         # Use table ID's to find the appropriate table. More flexible than xpath
+        def read_table(table_id):
+            return decode_table(tables[table_id]) if table_id in tables else None
+
         player_stats = dict()
         for i, (team, team_id) in enumerate([("Home", home_team_id), ("Away", away_team_id)]):
-            summary_tag = soup.find_all("table", {"id": re.compile(f"stats_{team_id}_summary")})
-            assert len(summary_tag) < 2
-            summary_df = pd.read_html(str(summary_tag[0]))[0] if len(summary_tag) == 1 else None
-
-            gk_tag = soup.find_all("table", {"id": re.compile(f"keeper_stats_{team_id}")})
-            assert len(gk_tag) < 2
-            gk_df = pd.read_html(str(gk_tag[0]))[0] if len(gk_tag) == 1 else None
-
-            passing_tag = soup.find_all("table", {"id": re.compile(f"stats_{team_id}_passing$")})
-            assert len(passing_tag) < 2
-            passing_df = pd.read_html(str(passing_tag[0]))[0] if len(passing_tag) == 1 else None
-
-            pass_types_tag = soup.find_all("table", {"id": re.compile(f"stats_{team_id}_passing_types")})
-            assert len(pass_types_tag) < 2
-            pass_types_df = pd.read_html(str(pass_types_tag[0]))[0] if len(pass_types_tag) == 1 else None
-
-            defense_tag = soup.find_all("table", {"id": re.compile(f"stats_{team_id}_defense")})
-            assert len(defense_tag) < 2
-            defense_df = pd.read_html(str(defense_tag[0]))[0] if len(defense_tag) == 1 else None
-
-            possession_tag = soup.find_all("table", {"id": re.compile(f"stats_{team_id}_possession")})
-            assert len(possession_tag) < 2
-            possession_df = pd.read_html(str(possession_tag[0]))[0] if len(possession_tag) == 1 else None
-
-            misc_tag = soup.find_all("table", {"id": re.compile(f"stats_{team_id}_misc")})
-            assert len(misc_tag) < 2
-            misc_df = pd.read_html(str(misc_tag[0]))[0] if len(misc_tag) == 1 else None
+            summary_df = read_table(f"stats_{team_id}_summary")
+            gk_df = read_table(f"keeper_stats_{team_id}")
+            passing_df = read_table(f"stats_{team_id}_passing")
+            pass_types_df = read_table(f"stats_{team_id}_passing_types")
+            defense_df = read_table(f"stats_{team_id}_defense")
+            possession_df = read_table(f"stats_{team_id}_possession")
+            misc_df = read_table(f"stats_{team_id}_misc")
 
             lineup_df = pd.read_html(str(lineup_tags[i]))[0] if len(lineup_tags) != 0 else None
 
             # Field player ID's for the stats tables -------------------------------------------------------------------
             # Note: if a coach gets a yellow/red card, they appear in the player stats tables, in their own row, at the
-            # bottom.
+            # bottom. Coaches and the summary row have no player link, so get an empty ID.
             if summary_df is not None:
-                player_ids = list()
-                # Iterate across all els that are player/coach names in the summary stats table
-                for tag in summary_tag[0].find_all("th", {"data-stat": "player", "scope": "row", "class": "left"}):
-                    if tag.find("a"):
-                        # if th el has an a subel, it should contain an href link to the player
-                        player_id = tag.find("a")["href"].split("/")[3]
-                    else:
-                        # coaches and the summary row have now a subel (and no player id)
-                        player_id = ""
-                    player_ids.append(player_id)
+                player_ids = page["player_ids"][f"stats_{team_id}_summary"]
 
                 summary_df["Player ID"] = player_ids
                 if passing_df is not None:
@@ -515,9 +885,7 @@ class FBRef:
 
             # GK ID's --------------------------------------------------------------------------------------------------
             if gk_df is not None:
-                gk_ids = [tag.find("a")["href"].split("/")[3] for tag in gk_tag[0].find_all("th", {"data-stat": "player"}) if tag.find("a")]
-
-                gk_df["Player ID"] = gk_ids
+                gk_df["Player ID"] = [player_id for player_id in page["player_ids"][f"keeper_stats_{team_id}"] if player_id]
 
             # Build player stats dict ----------------------------------------------------------------------------------
             # This will be turned into a Series and then put into the match dataframe
@@ -533,33 +901,19 @@ class FBRef:
             }
 
         # Shots ========================================================================================================
-        both_shots = soup.find_all("table", {"id": "shots_all"})
-        if len(both_shots) == 1:
-            both_shots = pd.read_html(str(both_shots[0]))[0]
-            both_shots = both_shots[~both_shots.isna().all(axis=1)]
-        else:
-            both_shots = None
-        home_shots = soup.find_all("table", {"id": f"shots_{home_team_id}"})
-        if len(home_shots) == 1:
-            home_shots = pd.read_html(str(home_shots[0]))[0]
-            home_shots = home_shots[~home_shots.isna().all(axis=1)]
-        else:
-            home_shots = None
-        away_shots = soup.find_all("table", {"id": f"shots_{away_team_id}"})
-        if len(away_shots) == 1:
-            away_shots = pd.read_html(str(away_shots[0]))[0]
-            away_shots = away_shots[~away_shots.isna().all(axis=1)]
-        else:
-            away_shots = None
+        shots = dict()
+        for key, table_id in [("Both", "shots_all"), ("Home", f"shots_{home_team_id}"), ("Away", f"shots_{away_team_id}")]:
+            shots_df = read_table(table_id)
+            shots[key] = shots_df[~shots_df.isna().all(axis=1)] if shots_df is not None else None
 
         # Expected stats flag ==========================================================================================
         expected = "Expected" in player_stats["Home"]["Summary"].columns.get_level_values(0)
 
-        # Build match series ===========================================================================================
-        match = pd.Series(dtype=object)
+        # Build match table ============================================================================================
+        match = dict()
         match["Link"] = link
         match["Date"] = datetime.strptime(
-            str(soup.find("h1")).split("<br/>")[0].split("–")[-1].replace("</h1>", "").split("(")[0].strip(),  # not a normal dash
+            str(page["h1"]).split("<br/>")[0].split("–")[-1].replace("</h1>", "").split("(")[0].strip(),  # not a normal dash
             "%A %B %d, %Y",
         ).date()
         match["Stage"] = stage
@@ -579,16 +933,33 @@ class FBRef:
         match["Away npxG"] = player_stats["Away"]["Summary"][("Expected", "npxG")].values[-1] if expected else None
         match["Home xAG"] = player_stats["Home"]["Summary"][("Expected", "xAG")].values[-1] if expected else None
         match["Away xAG"] = player_stats["Away"]["Summary"][("Expected", "xAG")].values[-1] if expected else None
-        match["Home Player Stats"] = pd.Series(player_stats["Home"]).to_frame()
-        match["Away Player Stats"] = pd.Series(player_stats["Away"]).to_frame()
-        match["Shots"] = pd.Series(
-            {
-                "Both": both_shots,
-                "Home": home_shots,
-                "Away": away_shots,
-            }
-        )
 
-        match = match.to_frame().T  # series to dataframe
-
-        return match
+        # Build player, keeper and shot tables =========================================================================
+        # Each team's stats tables list the same players in the same order, so they are joined side by side
+        players, keepers = list(), list()
+        for team, team_id in [("Home", home_team_id), ("Away", away_team_id)]:
+            tables = [flatten_columns(df, key.title()) for key, df in player_stats[team].items() if key not in ["Team Sheet", "GK"] and df is not None]
+            if len(tables) > 0:
+                team_players = pd.concat(tables, axis=1).iloc[:-1]  # last row is the team total
+                team_players.insert(0, "Link", link)
+                team_players.insert(1, "Side", team)
+                team_players.insert(2, "Team ID", team_id)
+                players.append(team_players)
+            if player_stats[team]["GK"] is not None:
+                team_keepers = flatten_columns(player_stats[team]["GK"], "Gk")
+                team_keepers.insert(0, "Link", link)
+                team_keepers.insert(1, "Side", team)
+                team_keepers.insert(2, "Team ID", team_id)
+                keepers.append(team_keepers)
+
+        shots = shots["Both"] if shots["Both"] is not None else pd.concat([shots["Home"], shots["Away"]]) if shots["Home"] is not None else None
+        if shots is not None:
+            shots = flatten_columns(shots)
+            shots.insert(0, "Link", link)
+
+        return {
+            "matches": pd.DataFrame([match]),
+            "players": pd.concat(players, ignore_index=True) if players else None,
+            "keepers": pd.concat(keepers, ignore_index=True) if keepers else None,
+            "shots": shots,
+        }
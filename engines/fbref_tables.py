@@ -0,0 +1,204 @@
+"""Helpers for reading FBRef tables straight from the HTML, without a browser."""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+COMMENT_PATTERN = re.compile(r"<!--(.*?)-->", re.S)
+
+# columns that are identifiers, shares, averages or already rates, so are never divided by 90s played
+NOT_PER90_COLUMNS = ["Rk", "Player", "Nation", "Pos", "Squad", "Age", "Born", "# Pl", "MP", "Starts", "Min", "90s", "Matches", "Mn/MP", "Min%", "Mn/Start", "Mn/Sub", "PPM", "Poss", "Dist", "AvgLen", "AvgDist", "Player Link", "Player ID", "Team ID"]
+
+
+def uncomment_tables(html: str) -> str:
+    """FBRef ships most tables inside HTML comments and only renders them with JS. Unwraps those comments."""
+    return COMMENT_PATTERN.sub(lambda m: m.group(1) if "<table" in m.group(1) else m.group(0), html)
+
+
+def per90(df: pd.DataFrame) -> pd.DataFrame:
+    """Divides every counting stat in an FBRef stats table by its 90s column, like the per 90 toggle on the site.
+
+    Percentages, averages, ratios and the columns in NOT_PER90_COLUMNS are left untouched, as is anything under a
+    "Per 90 Minutes" header.
+    """
+    nineties = [col for col in df.columns if (col[-1] if isinstance(col, tuple) else col) == "90s"]
+    if not nineties:
+        print("No 90s column found, cannot normalize to per 90")
+        return df
+    df = df.copy()
+    minutes = pd.to_numeric(df[nineties[0]], errors="coerce")
+    for col in df.columns:
+        group, name = (col[0], col[-1]) if isinstance(col, tuple) else ("", col)
+        if name in NOT_PER90_COLUMNS or "Per 90" in group or "%" in name or "/" in name:
+            continue
+        values = pd.to_numeric(df[col], errors="coerce")
+        if values.isna().all() or values.notna().sum() < df[col].notna().sum():
+            continue  # not a numeric column
+        df[col] = (values / minutes).replace([np.inf, -np.inf], np.nan)
+    return df
+
+
+def player_ids(table, data_stat: str = "player") -> list:
+    """IDs from the player links in a table's row headers. Rows without a link (coaches, totals) get ""."""
+    ids = list()
+    for tag in table.find_all("th", {"data-stat": data_stat, "scope": "row", "class": "left"}):
+        link = tag.find("a", href=True)
+        ids.append(link["href"].split("/")[3] if link is not None else "")
+    return ids
+
+
+def index_match_page(soup) -> dict:
+    """Indexes an FBRef match report in a single traversal of the document.
+
+    Returns a dict with the "tables" by id, the "scorebox" div, the "lineups" tables, the "h1" tag, the "stage" link
+    (the competition link with the matchweek next to it) and the "player_ids" of every player stats table by table id.
+    """
+    page = {"tables": dict(), "scorebox": None, "lineups": list(), "h1": None, "stage": None, "player_ids": dict()}
+    for tag in soup.find_all(["table", "div", "h1", "a"]):
+        if tag.name == "table":
+            table_id = tag.get("id")
+            if table_id is not None and table_id not in page["tables"]:
+                page["tables"][table_id] = tag
+                if table_id.startswith("stats_") or table_id.startswith("keeper_stats_"):
+                    page["player_ids"][table_id] = player_ids(tag)
+        elif tag.name == "div":
+            classes = tag.get("class") or []
+            if "scorebox" in classes and page["scorebox"] is None:
+                page["scorebox"] = tag
+            elif "lineup" in classes:
+                page["lineups"].append(tag.find("table"))
+        elif tag.name == "h1":
+            if page["h1"] is None:
+                page["h1"] = tag
+        elif page["stage"] is None and "-Stats" in tag.get("href", "") and tag.string is not None:
+            page["stage"] = tag
+    return page
+
+
+def _cell_text(cell) -> str:
+    return cell.get_text().strip()
+
+
+def _to_column(values: list) -> np.ndarray:
+    """Types a column of cell strings the way pd.read_html does: int64, then float64, else object. "" is missing."""
+    missing = [value == "" for value in values]
+    if all(missing):
+        return np.full(len(values), np.nan)
+    numbers = [value.replace(",", "") for value in values]  # thousands separators, e.g. minutes played
+    if not any(missing):
+        try:
+            return np.array([int(number) for number in numbers], dtype=np.int64)
+        except ValueError:
+            pass
+    try:
+        return np.array([np.nan if m else float(number) for number, m in zip(numbers, missing)], dtype=np.float64)
+    except ValueError:
+        return np.array([np.nan if m else value for value, m in zip(values, missing)], dtype=object)
+
+
+def decode_table(table) -> pd.DataFrame:
+    """Decodes an FBRef stats table (a BeautifulSoup tag) straight into a DataFrame.
+
+    Equivalent to `pd.read_html(str(table))[0]` for FBRef tables, without serializing the tag and parsing it again:
+    the over header row becomes the first column level ("Unnamed: i_level_0" where blank), duplicated columns get
+    ".1", ".2", ... suffixes, tfoot rows come last and columns are typed as int, float or object. Cells are matched to
+    columns by their data-stat attribute and the repeated header rows FBRef puts in long tables are dropped. Tables
+    without a thead (e.g. lineups) go through pd.read_html.
+    """
+    thead = table.find("thead")
+    if thead is None:
+        return pd.read_html(str(table))[0]
+    header_rows = thead.find_all("tr")
+    header = header_rows[-1].find_all(["th", "td"])
+    names = [_cell_text(cell) for cell in header]
+    stats = [cell.get("data-stat") for cell in header]
+    positions = {stat: i for i, stat in enumerate(stats) if stat is not None}
+
+    # column levels ----------------------------------------------------------------------------------------------------
+    if len(header_rows) > 1:
+        groups = list()
+        for cell in header_rows[-2].find_all(["th", "td"]):
+            groups += [_cell_text(cell)] * int(cell.get("colspan", 1))
+        groups = (groups + [""] * len(names))[: len(names)]
+        columns = [(group if group else f"Unnamed: {i}_level_0", name) for i, (group, name) in enumerate(zip(groups, names))]
+    else:
+        columns = names
+    seen = dict()
+    for i, column in enumerate(columns):
+        if column in seen:
+            seen[column] += 1
+            columns[i] = column[:-1] + (f"{column[-1]}.{seen[column]}",) if isinstance(column, tuple) else f"{column}.{seen[column]}"
+        else:
+            seen[column] = 0
+
+    # rows -------------------------------------------------------------------------------------------------------------
+    rows = list()
+    sections = table.find_all(["tbody", "tfoot"], recursive=False) or [table]
+    for section in sections:
+        for tr in section.find_all("tr", recursive=False):
+            if "thead" in (tr.get("class") or []):
+                continue  # repeated header row
+            row = [""] * len(names)
+            i = 0
+            for cell in tr.find_all(["th", "td"], recursive=False):
+                text = _cell_text(cell)
+                span = int(cell.get("colspan", 1))
+                start = positions.get(cell.get("data-stat"), i)
+                for j in range(start, min(start + span, len(names))):
+                    row[j] = text
+                i = start + span
+            rows.append(row)
+
+    data = {i: _to_column([row[i] for row in rows]) for i in range(len(names))}
+    df = pd.DataFrame(data)
+    df.columns = pd.MultiIndex.from_tuples(columns) if columns and isinstance(columns[0], tuple) else columns
+    return df
+
+
+MATCH_TABLES = ["matches", "players", "keepers", "shots"]
+
+
+def flatten_columns(df: pd.DataFrame, prefix: str = None) -> pd.DataFrame:
+    """Joins two-level FBRef columns into single names, e.g. ("Performance", "Gls") -> "Performance_Gls".
+
+    Unnamed groups are dropped and `prefix` (e.g. "Summary") is prepended with a space, as stats_scraper expects.
+    """
+    parsed = list()
+    for col in df.columns:
+        if not isinstance(col, tuple):
+            parsed.append(col)
+        elif "Unnamed" in col[0]:
+            parsed.append(col[1])
+        elif col[0] == col[1]:
+            parsed.append(col[0])
+        else:
+            parsed.append(col[0] + " " + col[1])
+    df = df.copy()
+    df.columns = [(f"{prefix} " if prefix else "") + x.strip().replace(" ", "_") for x in parsed]
+    return df
+
+
+class MatchBatch:
+    """Accumulates the flat tables of scraped matches (see FBRef.parse_match()) and concatenates each table once.
+
+    Tables are "matches" (one row per match), "players" (one row per player and match, with a "Side" column), "keepers"
+    and "shots", all keyed by the match "Link". Columns keep the dtypes decode_table gave them.
+    """
+
+    def __init__(self):
+        self.parts = {name: list() for name in MATCH_TABLES}
+
+    def append(self, match: dict):
+        for name in MATCH_TABLES:
+            if match.get(name) is not None and len(match[name]) > 0:
+                self.parts[name].append(match[name])
+
+    def __len__(self) -> int:
+        return len(self.parts["matches"])
+
+    def to_frames(self) -> dict:
+        frames = {name: pd.concat(parts, ignore_index=True) if parts else pd.DataFrame() for name, parts in self.parts.items()}
+        if len(frames["matches"]) > 0:
+            frames["matches"] = frames["matches"].sort_values(by="Date", kind="stable", ignore_index=True)
+        return frames
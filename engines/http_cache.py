@@ -0,0 +1,174 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+CACHE_DIR = "data/cache/http"
+CACHE_MAX_BYTES = 1024**3  # 1 GB of compressed pages, least recently used entries are evicted past this
+
+# (url pattern, ttl in seconds), the first pattern that matches wins. None never expires
+CACHE_TTLS = [
+    (r"fbref\.com/en/matches/", 7 * 24 * 60 * 60),  # match reports only change for late stat corrections
+    (r"/matchlogs/", 12 * 60 * 60),
+    (r"/schedule/", 6 * 60 * 60),
+    (r"/history/", 24 * 60 * 60),
+    (r"fbref\.com/en/comps/", 12 * 60 * 60),
+    (r"", 60 * 60),
+]
+
+CACHE_MODES = ["on", "off", "only"]  # "only" serves every cached entry regardless of age and never hits the network
+
+
+class HTTPCache:
+    """Compressed on-disk cache of successful GET responses.
+
+    Each entry is a gzip file named after the sha256 of its URL, holding a JSON header line (url, fetch time,
+    validators, headers) followed by the raw body. File mtimes double as the LRU clock: hits touch the file and
+    writes evict the least recently used files once the directory grows past `max_bytes`.
+    """
+
+    def __init__(self, path: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES, ttls: list = None, mode: str = "on"):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in (ttls if ttls is not None else CACHE_TTLS)]
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.size = None  # bytes on disk, counted lazily on the first write
+
+    def _fpath(self, url: str) -> str:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.path, key[:2], key + ".gz")
+
+    def ttl(self, url: str):
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return 0
+
+    def get(self, url: str) -> dict:
+        """Returns the cached entry for url (its metadata plus a "body" key), or None."""
+        fpath = self._fpath(url)
+        try:
+            with gzip.open(fpath, "rb") as f:
+                entry = json.loads(f.readline())
+                entry["body"] = f.read()
+            os.utime(fpath)
+        except (OSError, ValueError, EOFError):
+            return None
+        if entry.get("url") != url:
+            return None
+        return entry
+
+    def is_fresh(self, entry: dict) -> bool:
+        ttl = self.ttl(entry["url"])
+        return ttl is None or time.time() - entry["fetched_at"] < ttl
+
+    def conditional_headers(self, entry: dict) -> dict:
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url: str, response: requests.Response):
+        entry = {
+            "url": url,
+            "fetched_at": time.time(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "encoding": response.encoding,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() not in ["content-encoding", "content-length", "transfer-encoding"]},
+        }
+        self._write(url, entry, response.content)
+
+    def touch(self, url: str, entry: dict):
+        """Marks an entry as just validated, after a 304 Not Modified."""
+        entry = dict(entry)
+        body = entry.pop("body")
+        entry["fetched_at"] = time.time()
+        self._write(url, entry, body)
+
+    def invalidate(self, url: str):
+        """Drops the entry for url, so the next request fetches it again."""
+        fpath = self._fpath(url)
+        try:
+            size = os.path.getsize(fpath)
+            os.remove(fpath)
+        except OSError:
+            return
+        with self.lock:
+            if self.size is not None:
+                self.size -= size
+
+    def _write(self, url: str, entry: dict, body: bytes):
+        fpath = self._fpath(url)
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        tmp_fpath = f"{fpath}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_fpath, "wb", compresslevel=6) as f:
+            f.write(json.dumps(entry).encode() + b"\n")
+            f.write(body)
+        new_size = os.path.getsize(tmp_fpath)
+        old_size = os.path.getsize(fpath) if os.path.exists(fpath) else 0
+        os.replace(tmp_fpath, fpath)
+        with self.lock:
+            if self.size is None:
+                self.size = self._disk_usage()
+            else:
+                self.size += new_size - old_size
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _files(self):
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith(".gz"):
+                    yield os.path.join(root, name)
+
+    def _disk_usage(self) -> int:
+        return sum(os.path.getsize(fpath) for fpath in self._files())
+
+    def _evict(self):
+        # drop the least recently used entries until we are 10% under the cap
+        entries = sorted((os.stat(fpath).st_mtime, os.path.getsize(fpath), fpath) for fpath in self._files())
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, fpath in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(fpath)
+                self.size -= size
+            except OSError:
+                pass
+
+    def to_response(self, url: str, entry: dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = url
+        response._content = entry["body"]
+        response.headers = CaseInsensitiveDict(entry.get("headers", {}))
+        response.encoding = entry.get("encoding")
+        response.from_cache = True
+        return response
+
+
+HTTP_CACHE = HTTPCache()
+
+
+def configure_cache(mode: str = None, path: str = None, max_bytes: int = None):
+    if mode is not None:
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Invalid cache mode {mode}. Must be one of {CACHE_MODES}")
+        HTTP_CACHE.mode = mode
+    if path is not None:
+        HTTP_CACHE.path = path
+        HTTP_CACHE.size = None
+    if max_bytes is not None:
+        HTTP_CACHE.max_bytes = max_bytes
@@ -0,0 +1,133 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+LEDGER_FPATH = "data/cache/ledger.sqlite3"
+# committed record of the scraped links by host. The ledger itself only lives in the workflow cache, so every "done"
+# link is also appended here, and a ledger built from scratch imports these files once, as "done"
+LINKS_FPATHS = {"fbref.com": "data/cache/fbref_links.txt", "www.whoscored.com": "data/cache/whoscored_links.txt"}
+LEGACY_LINKS_FPATHS = list(LINKS_FPATHS.values())
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scraped (
+    url TEXT PRIMARY KEY,
+    host TEXT,
+    status TEXT NOT NULL,
+    fetched_at REAL,
+    content_hash TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS imported (fpath TEXT PRIMARY KEY, imported_at REAL);
+"""
+
+
+class ScrapeLedger:
+    """SQLite record of every scraped URL with its status ("done" or "failed"), fetch time, content hash and attempts.
+
+    Lookups go through the primary key index, so filtering a season's links is linear in the number of links, not
+    links times history. Writes are serialized by a lock within the process and by SQLite's file lock across processes.
+    Newly "done" links are also appended to the committed *_links.txt file of their host (`links_fpaths`), which a new
+    ledger imports as "done" the first time it is opened. So losing the ledger never makes done links look new.
+    """
+
+    def __init__(self, fpath: str = LEDGER_FPATH, links_fpaths: dict = LINKS_FPATHS):
+        self.fpath = fpath
+        self.links_fpaths = links_fpaths
+        self.legacy_fpaths = list(links_fpaths.values())
+        self.lock = threading.Lock()
+        self.conn = None  # opened lazily
+
+    def _connect(self) -> sqlite3.Connection:
+        # callers hold self.lock
+        if self.conn is None:
+            if os.path.dirname(self.fpath):
+                os.makedirs(os.path.dirname(self.fpath), exist_ok=True)
+            self.conn = sqlite3.connect(self.fpath, timeout=60, check_same_thread=False)
+            self.conn.executescript(SCHEMA)
+            self._import_legacy()
+        return self.conn
+
+    def _import_legacy(self):
+        for fpath in self.legacy_fpaths:
+            if not os.path.exists(fpath) or self.conn.execute("SELECT 1 FROM imported WHERE fpath = ?", (fpath,)).fetchone():
+                continue
+            with open(fpath, "r") as f:
+                urls = [line.strip() for line in f if line.strip()]
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO scraped (url, host, status, fetched_at, attempts) VALUES (?, ?, 'done', ?, 1)",
+                    [(url, urlparse(url).hostname, os.path.getmtime(fpath)) for url in urls],
+                )
+                self.conn.execute("INSERT INTO imported VALUES (?, ?)", (fpath, time.time()))
+            print(f"Imported {len(urls)} scraped links from {fpath} into {self.fpath}")
+
+    def is_done(self, url: str) -> bool:
+        with self.lock:
+            row = self._connect().execute("SELECT status FROM scraped WHERE url = ?", (url,)).fetchone()
+        return row is not None and row[0] == "done"
+
+    def filter_new(self, urls: list) -> list:
+        """Returns the urls that have not been scraped successfully yet, in their original order."""
+        urls = list(urls)
+        done = set()
+        with self.lock:
+            conn = self._connect()
+            for i in range(0, len(urls), 500):  # stay under SQLite's bound parameter limit
+                chunk = urls[i : i + 500]
+                query = f"SELECT url FROM scraped WHERE status = 'done' AND url IN ({','.join('?' * len(chunk))})"
+                done.update(url for (url,) in conn.execute(query, chunk))
+        return [url for url in urls if url not in done]
+
+    def record(self, url: str, status: str = "done", content: bytes = None):
+        self.record_many([url], status, [content])
+
+    def record_many(self, urls: list, status: str = "done", contents: list = None):
+        """Upserts urls with their status, bumping their attempt counts. Content hashes are kept if content is None."""
+        now = time.time()
+        contents = contents if contents is not None else [None] * len(urls)
+        rows = [(url, urlparse(url).hostname, status, now, hashlib.sha256(content).hexdigest() if content is not None else None) for url, content in zip(urls, contents)]
+        with self.lock:
+            conn = self._connect()
+            if status == "done":
+                self._append_links(conn, urls)
+            with conn:
+                conn.executemany(
+                    """INSERT INTO scraped (url, host, status, fetched_at, content_hash, attempts) VALUES (?, ?, ?, ?, ?, 1)
+                    ON CONFLICT(url) DO UPDATE SET status = excluded.status, fetched_at = excluded.fetched_at,
+                    content_hash = COALESCE(excluded.content_hash, content_hash), attempts = attempts + 1""",
+                    rows,
+                )
+
+    def _append_links(self, conn: sqlite3.Connection, urls: list):
+        # callers hold self.lock. Appends the urls that are not done yet to their host's links file
+        done = set()
+        for i in range(0, len(urls), 500):
+            chunk = urls[i : i + 500]
+            query = f"SELECT url FROM scraped WHERE status = 'done' AND url IN ({','.join('?' * len(chunk))})"
+            done.update(url for (url,) in conn.execute(query, chunk))
+        by_fpath = dict()
+        for url in dict.fromkeys(urls):
+            fpath = self.links_fpaths.get(urlparse(url).hostname)
+            if fpath is not None and url not in done:
+                by_fpath.setdefault(fpath, []).append(url)
+        for fpath, new_urls in by_fpath.items():
+            if os.path.dirname(fpath):
+                os.makedirs(os.path.dirname(fpath), exist_ok=True)
+            with open(fpath, "a+") as f:
+                if f.tell() > 0:
+                    f.seek(f.tell() - 1)
+                    if f.read(1) != "\n":
+                        f.write("\n")
+                f.writelines(url + "\n" for url in new_urls)
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+LEDGER = ScrapeLedger()
@@ -0,0 +1,138 @@
+import gzip
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from bs4 import BeautifulSoup
+from tqdm import tqdm
+
+from .fbref_tables import uncomment_tables, decode_table
+from .request_utils import get_request
+from .http_cache import HTTP_CACHE
+from .season_catalog import CURRENT_SEASON_TTL
+
+MATCH_LOGS_DIR = "data/cache/match_logs"
+MATCH_LOG_CATEGORIES = ["shooting", "keeper", "passing", "passing_types", "gca", "defense", "possession", "misc"]
+MATCH_LOG_PAGES = MATCH_LOG_CATEGORIES + ["schedule"]
+MAX_WORKERS = 8  # the fbref.com rate limit, not the number of threads, bounds the fetch rate
+
+
+def match_logs_url(team_id: str, year: int, page: str) -> str:
+    """All competitions match log page of a team, e.g. .../squads/b8fd03ef/2022-2023/matchlogs/all_comps/passing"""
+    return f"https://fbref.com/en/squads/{team_id}/{year-1}-{year}/matchlogs/all_comps/{page}"
+
+
+def is_current_season(year: int) -> bool:
+    """Whether the season ending in `year` may still get new matches. Seasons before the current year are final."""
+    return year >= datetime.now().year
+
+
+def fetch_match_log(url: str, refresh: bool = False):
+    """Fetches a match log page and decodes its first table, like `pd.read_html(...)[0]`. `refresh` skips the HTTP cache."""
+    if refresh and HTTP_CACHE.mode == "on":  # cache only runs keep what they have
+        HTTP_CACHE.invalidate(url)
+    response = get_request(url)
+    if response is None:
+        raise Exception(f"no response for {url}")
+    table = BeautifulSoup(uncomment_tables(response.text), "lxml").find("table")
+    if table is None:
+        raise Exception(f"no table in {url}")
+    return decode_table(table)
+
+
+class MatchLogCache:
+    """Decoded match log tables of a season, one gzip pickle per (season, team) holding {page: DataFrame}.
+
+    Logs of past seasons never change, so they are served from disk forever. Logs of the current season expire after
+    `current_ttl` seconds.
+    """
+
+    def __init__(self, path: str = MATCH_LOGS_DIR, current_ttl: float = CURRENT_SEASON_TTL):
+        self.path = path
+        self.current_ttl = current_ttl
+        self.lock = threading.Lock()
+
+    def _fpath(self, year: int, team_id: str) -> str:
+        return os.path.join(self.path, str(year), f"{team_id}.pkl.gz")
+
+    def get(self, year: int, team_id: str) -> dict:
+        """Returns the cached tables of a team's season, or None if they are missing or stale."""
+        fpath = self._fpath(year, team_id)
+        try:
+            if is_current_season(year) and time.time() - os.path.getmtime(fpath) > self.current_ttl:
+                return None
+            with gzip.open(fpath, "rb") as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def put(self, year: int, team_id: str, tables: dict):
+        fpath = self._fpath(year, team_id)
+        with self.lock:
+            os.makedirs(os.path.dirname(fpath), exist_ok=True)
+            tmp_fpath = f"{fpath}.tmp"
+            with gzip.open(tmp_fpath, "wb") as f:
+                pickle.dump(tables, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_fpath, fpath)
+
+
+MATCH_LOG_CACHE = MatchLogCache()
+
+
+def fetch_match_logs(teams: dict, year: int, max_workers: int = MAX_WORKERS, cache: MatchLogCache = MATCH_LOG_CACHE, refresh: bool = False) -> dict:
+    """Fetches the match logs of many teams at once.
+
+    Every (team, page) URL that is not cached is planned up front and fetched concurrently, under the shared fbref.com
+    rate limit. Each page is decoded once, straight from the HTML. Teams whose pages were all fetched are cached.
+
+    Args
+    ----
+    teams : dict
+        Team name to FBRef team id
+    year : int
+        Calendar year that the season ends in
+    max_workers : int
+        OPTIONAL, default is MAX_WORKERS. Number of fetching threads.
+    cache : MatchLogCache
+        OPTIONAL, default is MATCH_LOG_CACHE. None disables caching.
+    refresh : bool
+        OPTIONAL, default is False. Refetch every page, bypassing both this cache and the HTTP cache, e.g. for teams\
+        that just played. The fresh tables are cached.
+    Returns
+    -------
+    : dict
+        Team name to {page: DataFrame} for every page in MATCH_LOG_PAGES. Teams with a failed page are left out.
+    """
+    logs = dict()
+    jobs = list()
+    for team, team_id in teams.items():
+        cached = cache.get(year, team_id) if cache is not None and not refresh else None
+        if cached is not None:
+            logs[team] = cached
+        else:
+            jobs += [(team, page, match_logs_url(team_id, year, page)) for page in MATCH_LOG_PAGES]
+    if not jobs:
+        return logs
+
+    tables = {team: dict() for team, _, _ in jobs}
+    failed = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch_match_log, url, refresh): (team, page) for team, page, url in jobs}
+        for future in tqdm(as_completed(futures), total=len(futures), desc=f"Scraping {year} match logs"):
+            team, page = futures[future]
+            try:
+                tables[team][page] = future.result()
+            except Exception as E:
+                print(f"Failed to get {page} match logs for team {team}: {E}")
+                failed.add(team)
+
+    for team, team_tables in tables.items():
+        if team in failed:
+            continue
+        logs[team] = team_tables
+        if cache is not None:
+            cache.put(year, teams[team], team_tables)
+    return logs
@@ -0,0 +1,257 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf")]  # in seconds
+
+
+def url_pattern(url: str) -> str:
+    """Collapses ids, seasons and slugs in a URL path so that e.g. every FBRef match report maps to /en/matches/*/*."""
+    segments = [s for s in urlparse(url).path.split("/") if s]
+    return "/" + "/".join("*" if re.search(r"\d", s) or s.count("-") >= 3 else s for s in segments)
+
+
+class Histogram:
+    def __init__(self, buckets: list = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q: float):
+        # upper bound of the bucket holding the q-th observation
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.buckets[-1]
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "mean": round(self.sum / self.count, 3) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+class FetchMetrics:
+    """Thread-safe counters and latency histograms for the fetch layer, keyed by (host, url pattern).
+
+    Fetchers report every attempt with `record_request()` (`source` is "network", "cache", "replay", "archive" or
+    "browser"), retries with `record_retry()` and rate limit waits with `record_sleep()`. CPU-bound stages such as
+    parsing are timed with the `timer()` context manager.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.endpoints = {}
+        self.stages = {}
+        self.pipelines = {}
+
+    def _endpoint(self, url: str) -> dict:
+        key = (urlparse(url).hostname or "", url_pattern(url))
+        if key not in self.endpoints:
+            self.endpoints[key] = {
+                "requests": Counter(),  # by source
+                "status": Counter(),
+                "retries": 0,
+                "bytes": 0,
+                "rate_limit_sleep": 0.0,
+                "latency": Histogram(),
+            }
+        return self.endpoints[key]
+
+    def record_request(self, url: str, status, latency: float, nbytes: int = 0, source: str = "network"):
+        with self.lock:
+            endpoint = self._endpoint(url)
+            endpoint["requests"][source] += 1
+            endpoint["status"][str(status)] += 1
+            endpoint["bytes"] += nbytes
+            if source in ["network", "browser"]:
+                endpoint["latency"].observe(latency)
+
+    def record_retry(self, url: str):
+        with self.lock:
+            self._endpoint(url)["retries"] += 1
+
+    def record_sleep(self, url: str, seconds: float):
+        if seconds <= 0:
+            return
+        with self.lock:
+            self._endpoint(url)["rate_limit_sleep"] += seconds
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.time() - start)
+
+    def record_stage(self, stage: str, seconds: float):
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = Histogram()
+            self.stages[stage].observe(seconds)
+
+    def record_pipeline(self, name: str, summary: dict):
+        """Keeps the latest PipelineStats summary of a pipeline."""
+        with self.lock:
+            self.pipelines[name] = summary
+
+    def summary(self) -> dict:
+        with self.lock:
+            endpoints = [
+                {
+                    "host": host,
+                    "pattern": pattern,
+                    "requests": dict(endpoint["requests"]),
+                    "status": dict(endpoint["status"]),
+                    "retries": endpoint["retries"],
+                    "bytes": endpoint["bytes"],
+                    "rate_limit_sleep": round(endpoint["rate_limit_sleep"], 3),
+                    "latency": endpoint["latency"].to_dict(),
+                }
+                for (host, pattern), endpoint in sorted(self.endpoints.items())
+            ]
+            return {
+                "wall_time": round(time.time() - self.started, 3),
+                "endpoints": endpoints,
+                "stages": {stage: histogram.to_dict() for stage, histogram in sorted(self.stages.items())},
+                "pipelines": dict(sorted(self.pipelines.items())),
+            }
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            stages = sorted(self.stages.items())
+            pipelines = sorted(self.pipelines.items())
+
+        def histogram_lines(name, labels, histogram):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else str(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        lines.append("# TYPE scraper_requests_total counter")
+        for (host, pattern), endpoint in endpoints:
+            for source, count in sorted(endpoint["requests"].items()):
+                lines.append(f'scraper_requests_total{{host="{host}",pattern="{pattern}",source="{source}"}} {count}')
+        lines.append("# TYPE scraper_responses_total counter")
+        for (host, pattern), endpoint in endpoints:
+            for status, count in sorted(endpoint["status"].items()):
+                lines.append(f'scraper_responses_total{{host="{host}",pattern="{pattern}",status="{status}"}} {count}')
+        for metric, key in [("scraper_retries_total", "retries"), ("scraper_response_bytes_total", "bytes"), ("scraper_rate_limit_sleep_seconds_total", "rate_limit_sleep")]:
+            lines.append(f"# TYPE {metric} counter")
+            for (host, pattern), endpoint in endpoints:
+                lines.append(f'{metric}{{host="{host}",pattern="{pattern}"}} {endpoint[key]}')
+        lines.append("# TYPE scraper_request_latency_seconds histogram")
+        for (host, pattern), endpoint in endpoints:
+            histogram_lines("scraper_request_latency_seconds", f'host="{host}",pattern="{pattern}"', endpoint["latency"])
+        lines.append("# TYPE scraper_stage_seconds histogram")
+        for stage, histogram in stages:
+            histogram_lines("scraper_stage_seconds", f'stage="{stage}"', histogram)
+        lines.append("# TYPE scraper_pipeline_utilization gauge")
+        for name, summary in pipelines:
+            for stage, stage_summary in summary["stages"].items():
+                lines.append(f'scraper_pipeline_utilization{{pipeline="{name}",stage="{stage}"}} {stage_summary["utilization"]}')
+        lines.append("# TYPE scraper_pipeline_queue_depth gauge")
+        for name, summary in pipelines:
+            for stat in ["mean", "max"]:
+                lines.append(f'scraper_pipeline_queue_depth{{pipeline="{name}",stat="{stat}"}} {summary["queue"][stat]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, json_path: str = None, prom_path: str = None):
+        for fpath, content in [(json_path, lambda: json.dumps(self.summary(), indent=2)), (prom_path, self.to_prometheus)]:
+            if fpath is None:
+                continue
+            if os.path.dirname(fpath):
+                os.makedirs(os.path.dirname(fpath), exist_ok=True)
+            with open(fpath, "w") as f:
+                f.write(content())
+
+
+class PipelineStats:
+    """Queue depth and per-stage utilization of a producer/consumer pipeline.
+
+    Each stage has a number of workers. Workers report the time they spend on an item with `busy()`, and the queue
+    between the stages is sampled with `sample_queue()`. A stage's utilization is its busy time over wall time times
+    workers: a stage near 1 is the bottleneck, one near 0 has workers to spare.
+    """
+
+    def __init__(self, workers: dict):
+        self.workers = workers
+        self.started = time.time()
+        self.busy_time = {stage: 0.0 for stage in workers}
+        self.items = {stage: 0 for stage in workers}
+        self.queue_samples = 0
+        self.queue_total = 0
+        self.queue_max = 0
+
+    def busy(self, stage: str, seconds: float):
+        self.busy_time[stage] += seconds
+        self.items[stage] += 1
+
+    def sample_queue(self, depth: int):
+        self.queue_samples += 1
+        self.queue_total += depth
+        self.queue_max = max(self.queue_max, depth)
+
+    def summary(self) -> dict:
+        wall = time.time() - self.started
+        return {
+            "wall_time": round(wall, 3),
+            "stages": {
+                stage: {
+                    "workers": workers,
+                    "items": self.items[stage],
+                    "busy": round(self.busy_time[stage], 3),
+                    "utilization": round(self.busy_time[stage] / (wall * workers), 3) if wall > 0 else 0.0,
+                }
+                for stage, workers in self.workers.items()
+            },
+            "queue": {"mean": round(self.queue_total / self.queue_samples, 2) if self.queue_samples else 0.0, "max": self.queue_max},
+        }
+
+    def report(self) -> str:
+        summary = self.summary()
+        stages = ", ".join(f"{stage} {s['utilization']:.0%} of {s['workers']} workers ({s['items']} items)" for stage, s in summary["stages"].items())
+        return f"{stages}, queue depth mean {summary['queue']['mean']} max {summary['queue']['max']}, {summary['wall_time']}s"
+
+
+METRICS = FetchMetrics()
+_EXPORT_PATHS = {}
+
+
+def configure_metrics(json_path: str = None, prom_path: str = None):
+    """Exports the fetch metrics as a JSON summary and/or a Prometheus text file when the process exits."""
+    if not _EXPORT_PATHS:
+        atexit.register(lambda: METRICS.export(**_EXPORT_PATHS))
+    _EXPORT_PATHS["json_path"] = json_path
+    _EXPORT_PATHS["prom_path"] = prom_path
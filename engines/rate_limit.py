@@ -0,0 +1,92 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+from .metrics import METRICS
+
+# requests allowed per period (in seconds) for each domain, shared by every thread of the process
+# as of 30-Oct-2022 FBRef blocks if requesting more than 20 requests/minute, 10/minute is the old 6s wait per request
+RATE_LIMITS = {
+    "fbref.com": (10, 60),
+    "whoscored.com": (20, 60),
+}
+
+
+class TokenBucket:
+    """Blocking token bucket that hands out request slots at a fixed rate.
+
+    Callers reserve the next free slot under the lock and sleep outside of it, so waiting threads queue up behind
+    each other and the bucket never sits idle while someone is waiting. `pause()` pushes every slot, including
+    those already reserved, past the given delay.
+    """
+
+    def __init__(self, requests: int, per: float, capacity: int = 1):
+        self.interval = per / requests
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.next_slot = 0.0  # theoretical arrival time of the next request
+        self.paused_until = 0.0
+
+    def acquire(self) -> float:
+        """Blocks until a request may be made and returns the time spent waiting."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                slot = max(now, self.next_slot - (self.capacity - 1) * self.interval, self.paused_until)
+                self.next_slot = max(self.next_slot, slot) + self.interval
+            delay = slot - now
+            if delay > 0:
+                time.sleep(delay)
+                waited += delay
+            with self.lock:
+                if time.monotonic() >= self.paused_until:
+                    return waited
+            # paused while we were sleeping, queue up again behind the pause
+
+    def pause(self, seconds: float):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.next_slot = max(self.next_slot, self.paused_until)
+
+
+_BUCKETS = {}
+_BUCKETS_LOCK = threading.Lock()
+
+
+def get_domain(url: str) -> str:
+    host = urlparse(url).hostname or ""
+    for domain in RATE_LIMITS:
+        if host == domain or host.endswith("." + domain):
+            return domain
+    return host
+
+
+def get_bucket(url: str) -> TokenBucket:
+    """Returns the shared bucket for the url's domain, or None if the domain is not rate limited."""
+    domain = get_domain(url)
+    if domain not in RATE_LIMITS:
+        return None
+    with _BUCKETS_LOCK:
+        if domain not in _BUCKETS:
+            _BUCKETS[domain] = TokenBucket(*RATE_LIMITS[domain])
+        return _BUCKETS[domain]
+
+
+def set_rate_limit(domain: str, requests: int, per: float):
+    with _BUCKETS_LOCK:
+        RATE_LIMITS[domain] = (requests, per)
+        _BUCKETS.pop(domain, None)
+
+
+def acquire(url: str) -> float:
+    bucket = get_bucket(url)
+    waited = bucket.acquire() if bucket is not None else 0.0
+    METRICS.record_sleep(url, waited)
+    return waited
+
+
+def pause(url: str, seconds: float):
+    bucket = get_bucket(url)
+    if bucket is not None:
+        bucket.pause(seconds)
@@ -0,0 +1,92 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+REPLAY_MODES = ["off", "record", "replay"]
+
+
+class ReplayArchive:
+    """Records every fetched page and serves it back without the network.
+
+    In "record" mode, fetchers call `record()` with what they got, keyed by a kind ("http" for get_request,
+    "browser" for a WebDriver page source, ...) and the URL. Each page is stored as a gzip file and a line with its
+    timing metadata is appended to index.jsonl. In "replay" mode `load()` returns the recorded page (sleeping for
+    the recorded fetch time if `realtime` is set) and nothing touches the network or starts a browser.
+    """
+
+    def __init__(self, path: str = None, mode: str = "off", realtime: bool = False):
+        self.path = path
+        self.mode = mode
+        self.realtime = realtime
+        self.lock = threading.Lock()
+
+    def _fpath(self, kind: str, url: str) -> str:
+        return os.path.join(self.path, kind, hashlib.sha256(url.encode()).hexdigest() + ".gz")
+
+    def record(self, kind: str, url: str, body: bytes, status: int = 200, headers: dict = None, encoding: str = None, elapsed: float = None):
+        entry = {
+            "kind": kind,
+            "url": url,
+            "status": status,
+            "encoding": encoding,
+            "headers": {k: v for k, v in (headers or {}).items() if k.lower() not in ["content-encoding", "content-length", "transfer-encoding"]},
+            "elapsed": elapsed,
+            "recorded_at": time.time(),
+        }
+        fpath = self._fpath(kind, url)
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        tmp_fpath = f"{fpath}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_fpath, "wb") as f:
+            f.write(json.dumps(entry).encode() + b"\n")
+            f.write(body)
+        os.replace(tmp_fpath, fpath)
+        entry.pop("headers")
+        entry["bytes"] = len(body)
+        with self.lock:
+            with open(os.path.join(self.path, "index.jsonl"), "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def load(self, kind: str, url: str) -> dict:
+        """Returns the recorded entry (metadata plus a "body" key), or None if url was never recorded."""
+        try:
+            with gzip.open(self._fpath(kind, url), "rb") as f:
+                entry = json.loads(f.readline())
+                entry["body"] = f.read()
+        except (OSError, ValueError, EOFError):
+            print(f"{kind} {url} is not in the replay archive at {self.path}")
+            return None
+        if self.realtime and entry.get("elapsed"):
+            time.sleep(entry["elapsed"])
+        return entry
+
+    def load_text(self, kind: str, url: str) -> str:
+        entry = self.load(kind, url)
+        return entry["body"].decode(entry.get("encoding") or "utf-8") if entry is not None else None
+
+    def to_response(self, url: str, entry: dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.url = url
+        response._content = entry["body"]
+        response.headers = CaseInsensitiveDict(entry.get("headers", {}))
+        response.encoding = entry.get("encoding")
+        return response
+
+
+REPLAY = ReplayArchive()
+
+
+def configure_replay(mode: str, path: str = None, realtime: bool = False):
+    if mode not in REPLAY_MODES:
+        raise ValueError(f"Invalid replay mode {mode}. Must be one of {REPLAY_MODES}")
+    if mode != "off" and path is None:
+        raise ValueError(f"A path to the archive is required in {mode} mode")
+    REPLAY.mode = mode
+    REPLAY.path = path
+    REPLAY.realtime = realtime
@@ -1,28 +1,67 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib.parse import urlparse
 import time
-import concurrent.futures
+import asyncio
+import aiohttp
 import pandas as pd
 import random
 from bs4 import BeautifulSoup
 import os
 import re
+import json
 from selenium.webdriver.firefox.options import Options as FirefoxOptions
 from selenium import webdriver
-import time
-import random
+import threading
+from collections import deque
 from tqdm import tqdm
+from . import rate_limit
+from .http_cache import HTTP_CACHE
+from .replay import REPLAY
+from .retry import RetryPolicy, get_breaker, parse_retry_after
+from .metrics import METRICS
+from .archive import ARCHIVE
 
 ip_pattern = r"\b\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\b"
 
 HEADERS = {"user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/75.0.3770.142 Safari/537.36"}
 
+PROXY_CHECK_URL = "https://httpbin.org/ip"
+WHOSCORED_URL = "https://www.whoscored.com"
+WHOSCORED_TITLE = "Football Statistics | Football Live Scores | WhoScored.com"
+
+PROXY_CACHE_FPATH = "data/cache/proxies.json"
+PROXY_CACHE_TTL = 6 * 60 * 60  # in seconds, free proxies rarely survive much longer than this
+
+
+def load_proxy_cache(ttl: float = PROXY_CACHE_TTL) -> dict:
+    """Returns {proxy: validated_at} for the cached proxies validated less than `ttl` seconds ago."""
+    if not os.path.exists(PROXY_CACHE_FPATH):
+        return {}
+    try:
+        with open(PROXY_CACHE_FPATH, "r") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    now = time.time()
+    return {proxy: validated_at for proxy, validated_at in cached.items() if now - validated_at < ttl}
+
+
+def save_proxy_cache(proxies: dict):
+    os.makedirs(os.path.dirname(PROXY_CACHE_FPATH), exist_ok=True)
+    tmp_fpath = PROXY_CACHE_FPATH + ".tmp"
+    with open(tmp_fpath, "w") as f:
+        json.dump(proxies, f, indent=1)
+    os.replace(tmp_fpath, PROXY_CACHE_FPATH)
 
-def setup_proxies():
-    if os.path.exists("proxies.txt"):
-        with open("proxies.txt", "r") as file:
-            proxies = file.readlines()
-            proxies = [proxy.strip() for proxy in proxies]
-            return proxies
+
+def setup_proxies(ttl: float = PROXY_CACHE_TTL) -> dict:
+    """Returns {proxy: validated_at}, from the on-disk cache when it still has fresh entries."""
+    cached = load_proxy_cache(ttl)
+    if cached:
+        print(f"Using {len(cached)} cached proxies")
+        return cached
     response = requests.get(
         "https://www.sslproxies.org/", headers={"user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/75.0.3770.142 Safari/537.36"}
     )
@@ -65,18 +104,18 @@ def setup_proxies():
     proxy_urls = list(set(proxy_urls))
 
     print(f"Found {len(proxy_urls)} proxies, using 10000 sample to test")
-    proxy_urls = random.sample(proxy_urls, 10000)
-    with concurrent.futures.ThreadPoolExecutor(max_workers=50) as executor:
-        valid_proxies = list(tqdm(executor.map(test_proxy, proxy_urls), total=len(proxy_urls), leave=False))
-
-    # Filter out None values
-    valid_proxies = [proxy for proxy in valid_proxies if proxy]
+    proxy_urls = random.sample(proxy_urls, min(len(proxy_urls), 10000))
+    # cheap async checks first (httpbin + plain HTTP WhoScored), browser only for the survivors
+    valid_proxies = asyncio.run(validate_proxies(proxy_urls))
     print(f"Testing {len(valid_proxies)} proxies")
     valid_proxies = [proxy for proxy in valid_proxies if test_whoscored(proxy, timeout=20)]
     valid_proxies = list(set(valid_proxies))
     # if len(valid_proxies) < 1:
     #     print("No valid proxies found. Retrying")
     #     return setup_proxies()
+    validated_at = time.time()
+    valid_proxies = {proxy: validated_at for proxy in valid_proxies}
+    save_proxy_cache(valid_proxies)
     return valid_proxies
 
 
@@ -109,10 +148,81 @@ def test_whoscored(proxy_url, timeout=60):
         return None
 
 
-def get_my_ip(proxies=None, verbose: bool = True):
+async def _check_ip(session: aiohttp.ClientSession, proxy_url: str, check_url: str, timeout: float):
+    try:
+        async with session.get(check_url, proxy=f"http://{proxy_url}", timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            if response.status != 200:
+                return None
+            ip_info = await response.json(content_type=None)
+            return ip_info.get("origin")
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, AttributeError):
+        return None
+
+
+async def _probe_proxy(session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, proxy_url: str, n_probes: int, check_url: str, timeout: float):
+    # same contract as test_proxy: every probe must exit through the proxy's own ip, stop at the first miss
+    ip = proxy_url.split(":")[0]
+    async with semaphore:
+        for _ in range(n_probes):
+            origin = await _check_ip(session, proxy_url, check_url, timeout)
+            if not origin or not origin.startswith(ip):
+                return None
+    return proxy_url
+
+
+async def _probe_whoscored(session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, proxy_url: str, whoscored_url: str, timeout: float):
+    # HTTP-level stand-in for test_whoscored, lets us drop dead exits before paying for a Firefox launch
+    async with semaphore:
+        try:
+            async with session.get(whoscored_url, proxy=f"http://{proxy_url}", timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                if response.status != 200:
+                    return None
+                text = await response.text(errors="ignore")
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return None
+    return proxy_url if WHOSCORED_TITLE in text else None
+
+
+async def validate_proxies(
+    proxy_urls: list,
+    concurrency: int = 500,
+    n_probes: int = 10,
+    timeout: float = 5,
+    check_url: str = PROXY_CHECK_URL,
+    whoscored_url: str = WHOSCORED_URL,
+    whoscored_timeout: float = 20,
+    verbose: bool = True,
+) -> list:
+    """Validates proxies concurrently and returns those that pass every probe.
+
+    Each proxy goes through `n_probes` sequential ip checks against `check_url` (rejected on the first failure) and,
+    as soon as it passes, a single HTTP request to `whoscored_url`. At most `concurrency` probes are in flight.
+    Pass `whoscored_url=None` to skip the WhoScored stage.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector, headers=HEADERS) as session:
+
+        async def pipeline(proxy_url):
+            proxy_url = await _probe_proxy(session, semaphore, proxy_url, n_probes, check_url, timeout)
+            if proxy_url is None or whoscored_url is None:
+                return proxy_url
+            return await _probe_whoscored(session, semaphore, proxy_url, whoscored_url, whoscored_timeout)
+
+        tasks = [asyncio.ensure_future(pipeline(proxy_url.strip())) for proxy_url in proxy_urls if proxy_url.strip()]
+        valid_proxies = []
+        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), leave=False, disable=not verbose):
+            proxy_url = await task
+            if proxy_url:
+                valid_proxies.append(proxy_url)
+    return list(set(valid_proxies))
+
+
+def get_my_ip(proxies=None, verbose: bool = True, check_url: str = PROXY_CHECK_URL):
     try:
         # HTTP
-        response = requests.get("https://httpbin.org/ip", proxies=proxies, timeout=5)
+        response = requests.get(check_url, proxies=proxies, timeout=5)
         response.raise_for_status()  # Raise an exception for HTTP errors
         ip_info = response.json()
         first = ip_info.get("origin")
@@ -131,11 +241,11 @@ def get_my_ip(proxies=None, verbose: bool = True):
         return None
 
 
-def test_proxy(proxy_url):
+def test_proxy(proxy_url, check_url: str = PROXY_CHECK_URL):
     proxy_dict = {"http": proxy_url, "https": proxy_url}
     c = 0
     for _ in range(10):
-        ip = get_my_ip(proxies=proxy_dict, verbose=False)
+        ip = get_my_ip(proxies=proxy_dict, verbose=False, check_url=check_url)
         if ip and ip.startswith(proxy_url.split(":")[0]):
             c += 1
         else:
@@ -145,42 +255,319 @@ def test_proxy(proxy_url):
     return None
 
 
-PROXIES = setup_proxies()
-print(f"Found {len(PROXIES)} valid proxies")
+class ProxyPool:
+    """Picks proxies weighted by their observed health.
+
+    Every request made through a proxy is reported back with `report()`. The pool keeps a scoreboard per proxy
+    (success rate, latency percentiles over the last `window` requests and recent 429s) and picks proxies with
+    probability proportional to `success rate / p50 latency`, divided again by the number of 429s seen in the last
+    `rate_limit_window` seconds. A proxy that fails `max_failures` times in a row is ejected for `eject_time`
+    seconds and then re-probed in the background with `probe` (doubling the ejection on every failed probe).
+    Successful re-probes refresh the proxy's validation timestamp in the on-disk proxy cache.
+    """
+
+    def __init__(self, proxies: dict, window: int = 50, max_failures: int = 3, eject_time: float = 300, rate_limit_window: float = 60, probe=None):
+        self.window = window
+        self.max_failures = max_failures
+        self.eject_time = eject_time
+        self.rate_limit_window = rate_limit_window
+        self.probe = probe if probe is not None else test_proxy
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.add(proxies)
+
+    def __len__(self):
+        with self.lock:
+            return len([proxy for proxy, entry in self.stats.items() if entry["ejected_until"] is None])
+
+    def add(self, proxies: dict):
+        """Adds proxies, given as {proxy: validated_at} or as a list of proxies validated just now."""
+        if not isinstance(proxies, dict):
+            proxies = {proxy: time.time() for proxy in proxies}
+        with self.lock:
+            for proxy, validated_at in proxies.items():
+                if proxy not in self.stats:
+                    self.stats[proxy] = {
+                        "validated_at": validated_at,
+                        "successes": 0,
+                        "failures": 0,
+                        "consecutive_failures": 0,
+                        "latencies": deque(maxlen=self.window),
+                        "rate_limited": deque(maxlen=self.window),
+                        "ejected_until": None,
+                        "eject_time": self.eject_time,
+                        "probing": False,
+                    }
+
+    def get(self):
+        """Returns a proxy url ("ip:port"), or None if the pool is empty."""
+        self._reprobe()
+        with self.lock:
+            now = time.time()
+            active = [proxy for proxy, entry in self.stats.items() if entry["ejected_until"] is None]
+            if not active:
+                # everything is ejected, fall back to whichever proxy comes back soonest
+                ejected = sorted(self.stats, key=lambda proxy: self.stats[proxy]["ejected_until"])
+                return ejected[0] if ejected else None
+            weights = [self._weight(self.stats[proxy], now) for proxy in active]
+        return random.choices(active, weights=weights)[0]
+
+    def report(self, proxy: str, ok: bool, latency: float = None, status: int = None):
+        with self.lock:
+            entry = self.stats.get(proxy)
+            if entry is None:
+                return
+            if latency is not None:
+                entry["latencies"].append(latency)
+            if status == 429:
+                entry["rate_limited"].append(time.time())
+            if ok:
+                entry["successes"] += 1
+                entry["consecutive_failures"] = 0
+                return
+            entry["failures"] += 1
+            entry["consecutive_failures"] += 1
+            if entry["consecutive_failures"] >= self.max_failures and entry["ejected_until"] is None:
+                entry["ejected_until"] = time.time() + entry["eject_time"]
+
+    def summary(self) -> dict:
+        with self.lock:
+            now = time.time()
+            return {
+                proxy: {
+                    "success_rate": self._success_rate(entry),
+                    "p50": self._percentile(entry["latencies"], 50),
+                    "p95": self._percentile(entry["latencies"], 95),
+                    "recent_429": self._recent_429(entry, now),
+                    "ejected": entry["ejected_until"] is not None,
+                }
+                for proxy, entry in self.stats.items()
+            }
+
+    def _weight(self, entry, now):
+        p50 = self._percentile(entry["latencies"], 50)
+        p50 = max(p50, 0.05) if p50 is not None else 1.0  # unseen proxies are treated as average
+        return self._success_rate(entry) / p50 / (1 + self._recent_429(entry, now))
+
+    def _success_rate(self, entry):
+        return (entry["successes"] + 1) / (entry["successes"] + entry["failures"] + 2)  # laplace smoothed
+
+    def _recent_429(self, entry, now):
+        return len([t for t in entry["rate_limited"] if now - t < self.rate_limit_window])
+
+    def _percentile(self, values, q):
+        if not values:
+            return None
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+    def _reprobe(self):
+        with self.lock:
+            now = time.time()
+            expired = [proxy for proxy, entry in self.stats.items() if entry["ejected_until"] is not None and entry["ejected_until"] <= now and not entry["probing"]]
+            for proxy in expired:
+                self.stats[proxy]["probing"] = True
+        for proxy in expired:
+            threading.Thread(target=self._probe_and_restore, args=(proxy,), daemon=True).start()
+
+    def _probe_and_restore(self, proxy):
+        try:
+            ok = bool(self.probe(proxy))
+        except Exception:
+            ok = False
+        with self.lock:
+            entry = self.stats[proxy]
+            entry["probing"] = False
+            if ok:
+                entry["ejected_until"] = None
+                entry["consecutive_failures"] = 0
+                entry["eject_time"] = self.eject_time
+                entry["validated_at"] = time.time()
+            else:
+                entry["eject_time"] *= 2
+                entry["ejected_until"] = time.time() + entry["eject_time"]
+            validated = {proxy: entry["validated_at"] for proxy, entry in self.stats.items()}
+        if ok:
+            save_proxy_cache(validated)
+
+
+_PROXY_POOL = None
+_PROXY_POOL_LOCK = threading.Lock()
+
+
+def get_proxy_pool() -> ProxyPool:
+    """Returns the shared ProxyPool, running setup_proxies() the first time a proxy is needed."""
+    global _PROXY_POOL
+    with _PROXY_POOL_LOCK:
+        if _PROXY_POOL is None:
+            _PROXY_POOL = ProxyPool(setup_proxies())
+            print(f"Found {len(_PROXY_POOL)} valid proxies")
+    return _PROXY_POOL
 
 
 def get_proxy():
-    idx = random.randint(0, len(PROXIES) - 1)
-    return {"http": PROXIES[idx], "https": PROXIES[idx]}
+    proxy = get_proxy_pool().get()
+    if proxy is None:
+        return None
+    return {"http": proxy, "https": proxy}
+
+
+SESSION_POOL_SIZE = 20  # keep-alive connections per (host, proxy), should be >= the number of threads fetching from one host
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def get_session(url: str, proxies: dict = None, scope: str = None) -> requests.Session:
+    """Returns the shared keep-alive session for the url's host (and proxy), creating it on first use.
+
+    Sessions are shared between threads, each one holds a pool of up to SESSION_POOL_SIZE connections and asks for
+    every compression urllib3 can decode (gzip/deflate, plus brotli/zstd when installed). Workers that must not share
+    cookies or connections (e.g. one scraper per league) pass their own `scope` and get sessions of their own.
+    """
+    key = (urlparse(url).netloc, proxies["https"] if proxies else None, scope)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SESSION_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(HEADERS)
+            session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+            if proxies:
+                session.proxies.update(proxies)
+            _SESSIONS[key] = session
+    return session
+
+
+def configure_sessions(pool_size: int):
+    """Sets the connection pool size per (host, proxy); sessions created before the call are closed."""
+    global SESSION_POOL_SIZE
+    SESSION_POOL_SIZE = pool_size
+    close_sessions()
 
 
-def get_request(url: str, timeout: int = 5, max_iter: int = 100, verbose: bool = True, proxy=None) -> requests.Response:
+def close_sessions():
+    with _SESSIONS_LOCK:
+        for session in _SESSIONS.values():
+            session.close()
+        _SESSIONS.clear()
+
+
+RETRY_POLICY = RetryPolicy()
+
+
+def get_request(
+    url: str,
+    timeout: int = 5,
+    max_iter: int = 100,
+    verbose: bool = True,
+    proxy=None,
+    use_cache: bool = True,
+    retry_policy: RetryPolicy = None,
+    session_scope: str = None,
+) -> requests.Response:
+    if REPLAY.mode == "replay":
+        entry = REPLAY.load("http", url)
+        if entry is None:
+            return None
+        METRICS.record_request(url, entry["status"], entry.get("elapsed") or 0.0, len(entry["body"]), source="replay")
+        return REPLAY.to_response(url, entry)
+    if ARCHIVE.mode == "only":
+        entry = ARCHIVE.load("http", url)
+        if entry is None:
+            return None
+        METRICS.record_request(url, 200, 0.0, len(entry["body"]), source="archive")
+        return ARCHIVE.to_response(url, entry)
+    start = time.time()
+    response = _get_request(url, timeout=timeout, max_iter=max_iter, verbose=verbose, proxy=proxy, use_cache=use_cache, retry_policy=retry_policy, session_scope=session_scope)
+    if REPLAY.mode == "record" and response is not None:
+        REPLAY.record("http", url, response.content, status=response.status_code, headers=response.headers, encoding=response.encoding, elapsed=time.time() - start)
+    return response
+
+
+def _get_request(url: str, timeout: int, max_iter: int, verbose: bool, proxy, use_cache: bool, retry_policy: RetryPolicy, session_scope: str) -> requests.Response:
     # url = url.replace("https://", "http://")
-    counter = 0
+    use_cache = use_cache and HTTP_CACHE.mode != "off"
+    cached = HTTP_CACHE.get(url) if use_cache else None
+    if cached is not None and (HTTP_CACHE.mode == "only" or HTTP_CACHE.is_fresh(cached)):
+        METRICS.record_request(url, 200, 0.0, len(cached["body"]), source="cache")
+        return HTTP_CACHE.to_response(url, cached)
+    if use_cache and HTTP_CACHE.mode == "only":
+        print(f"{url} is not cached, skipping it in cache-only mode")
+        return None
+    headers = HTTP_CACHE.conditional_headers(cached) if cached is not None else None
+
+    policy = retry_policy if retry_policy is not None else RETRY_POLICY
+    host = urlparse(url).netloc
+    started = time.time()
+    attempt = 0
     while True:
-        try:
-            response = requests.get(url, headers=HEADERS, proxies=get_proxy() if proxy else None, timeout=timeout)
-            if response.status_code == 200:
-                return response
-            elif response.status_code == 429:
-                timeout = int(response.headers.get("Retry-After"))
-                if verbose:
-                    print(f"Rate limited for url {url}. Retrying in {timeout} seconds")
-                if len(PROXIES) < 2:
-                    time.sleep(timeout)
-            else:
-                counter += 1
+        attempt += 1
+        delay = None  # None lets the policy pick the backoff
+        proxies = get_proxy() if proxy else None
+        breaker = get_breaker(host, proxies["https"] if proxies else None)
+        if not breaker.allow():
+            METRICS.record_request(url, "circuit_open", 0.0)
+            if not proxies:
+                print(f"{host} looks down, giving up on {url}")
+                return None
+            delay = 0  # this proxy looks down, draw another one right away
+        else:
+            start = time.time()
+            rate_limit.acquire(url)
+            started += time.time() - start  # waiting for the rate limit does not count toward the deadline
+            start = time.time()
+            try:
+                response = get_session(url, proxies, session_scope).get(url, headers=headers, proxies=proxies, timeout=timeout)
+                METRICS.record_request(url, response.status_code, time.time() - start, len(response.content))
+                if proxies:
+                    get_proxy_pool().report(proxies["https"], ok=response.status_code in [200, 304], latency=time.time() - start, status=response.status_code)
+                if response.status_code == 304 and cached is not None:
+                    breaker.record_success()
+                    HTTP_CACHE.touch(url, cached)
+                    return HTTP_CACHE.to_response(url, cached)
+                if response.status_code == 200:
+                    breaker.record_success()
+                    if use_cache:
+                        HTTP_CACHE.put(url, response)
+                    if ARCHIVE.mode == "on":  # network fetches only, cache hits were archived when first fetched
+                        ARCHIVE.store("http", url, response.content, encoding=response.encoding)
+                    return response
+                elif response.status_code in [404, 410]:
+                    breaker.record_success()  # the host is up, the page just does not exist
+                    print(f"{url} not found. Status code: {response.status_code}")
+                    return None
+                elif response.status_code == 429:
+                    breaker.record_success()  # the host is up, it just wants fewer requests
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    if retry_after is None:
+                        retry_after = policy.backoff(attempt)
+                    if verbose:
+                        print(f"Rate limited for url {url}. Retrying in {retry_after:.0f} seconds")
+                    if not proxy or len(get_proxy_pool()) < 2:
+                        # pause every thread fetching from this domain, the next rate_limit.acquire() waits it out
+                        rate_limit.pause(url, retry_after)
+                    delay = 0
+                else:
+                    if response.status_code >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()  # any other response shows the host is up
+                    if verbose:
+                        print(f"Retrying {attempt} times for {url}. Status code: {response.status_code}")
+            except Exception as e:
+                METRICS.record_request(url, type(e).__name__, time.time() - start)
+                breaker.record_failure()
+                if proxies:
+                    get_proxy_pool().report(proxies["https"], ok=False)
                 if verbose:
-                    print(f"Retrying {counter} times for {url}. Status code: {response.status_code}")
-                time.sleep(timeout)
-            if counter >= max_iter:
+                    print(f"An error occurred: {e}")
 
-                print(f"Max iterations reached for {url}")
-                return None
-        except Exception as e:
-            if verbose:
-                print(f"An error occurred: {e}")
-            counter += 1
+        if attempt >= max_iter or not policy.wait(attempt, started, delay):
+            print(f"Max iterations reached for {url}")
+            return None
+        METRICS.record_retry(url)
 
 
 if __name__ == "__main__":
@@ -188,10 +575,7 @@ if __name__ == "__main__":
     # while len(PROXIES) < 1:
     #     print("No valid proxies found. Retrying")
     #     PROXIES = setup_proxies()
-    for proxy in PROXIES:
+    # refreshes data/cache/proxies.json if it is stale
+    for proxy in get_proxy_pool().stats:
         proxy_dict = {"http": proxy, "https": proxy}
         print(f"Using {proxy}, IP:", get_my_ip(proxies=proxy_dict))
-
-    with open("proxies.txt", "w") as file:
-        for proxy in PROXIES:
-            file.write(proxy + "\n")
@@ -0,0 +1,99 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter, capped per attempt and bounded by a total deadline.
+
+    The n-th retry waits a random time between half and all of `min(cap, base * 2**n)` seconds, so threads that
+    failed together do not retry together.
+    """
+
+    def __init__(self, max_attempts: int = 100, base: float = 1.0, cap: float = 60.0, deadline: float = 600.0):
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+        self.deadline = deadline
+
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.cap, self.base * 2**attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def wait(self, attempt: int, started: float, delay: float = None) -> bool:
+        """Sleeps before the next attempt. Returns False, without sleeping, if the attempt or time budget is spent."""
+        if attempt >= self.max_attempts:
+            return False
+        delay = self.backoff(attempt) if delay is None else delay
+        if time.time() + delay - started > self.deadline:
+            return False
+        time.sleep(delay)
+        return True
+
+
+class CircuitBreaker:
+    """Fails fast once an endpoint is clearly down.
+
+    After `failure_threshold` consecutive failures the breaker opens and `allow()` returns False for `reset_timeout`
+    seconds. Then a single trial request is let through: success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 120.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at < self.reset_timeout or self.trial_running:
+                return False
+            self.trial_running = True  # half open
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+            self.trial_running = False
+
+
+_BREAKERS = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def get_breaker(host: str, proxy: str = None) -> CircuitBreaker:
+    with _BREAKERS_LOCK:
+        if (host, proxy) not in _BREAKERS:
+            _BREAKERS[(host, proxy)] = CircuitBreaker()
+        return _BREAKERS[(host, proxy)]
+
+
+def parse_retry_after(value: str) -> float:
+    """Parses a Retry-After header (delay in seconds or an HTTP date). Returns None if missing or invalid."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+import time
+
+SEASON_CATALOG_FPATH = "data/cache/fbref_seasons.json"
+CURRENT_SEASON_TTL = 24 * 60 * 60  # in seconds. The current season's URLs change once FBRef archives it
+
+
+def fixtures_url(season_url: str) -> str:
+    """Scores and fixtures page of a season, e.g. .../comps/9/2022-2023/schedule/2022-2023-Premier-League-Score-and-Fixtures"""
+    split = season_url.split("/")
+    first_half = "/".join(split[:-1])
+    second_half = split[-1].split("-")
+    second_half = "-".join(second_half[:-1]) + "-Score-and-Fixtures"
+    return first_half + "/schedule/" + second_half
+
+
+def stats_url(season_url: str, category_url: str) -> str:
+    """Stats category page of a season, e.g. .../comps/9/2022-2023/passing/2022-2023-Premier-League-Stats"""
+    old_suffix = season_url.split("/")[-1]
+    return season_url.replace(old_suffix, f"{category_url}/{old_suffix}")
+
+
+class SeasonCatalog:
+    """Persistent map of (league, year) to the FBRef URLs of that season.
+
+    One fetch of a league's history page lists every season, so `update()` stores all of them at once. Each entry has
+    the "season" URL, the "fixtures" URL and the "stats" URL of every stats category. Past seasons never expire, the
+    current one (the first row of the history page) is refetched after `current_ttl` seconds.
+    """
+
+    def __init__(self, fpath: str = SEASON_CATALOG_FPATH, current_ttl: float = CURRENT_SEASON_TTL):
+        self.fpath = fpath
+        self.current_ttl = current_ttl
+        self.lock = threading.Lock()
+        self.entries = None  # loaded lazily
+
+    def _load(self):
+        if self.entries is not None:
+            return
+        try:
+            with open(self.fpath, "r") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = dict()
+
+    def get(self, league: str, year: int) -> dict:
+        """Returns the cached entry for the season, or None if it is missing or stale."""
+        with self.lock:
+            self._load()
+            entry = self.entries.get(f"{league}/{year}")
+        if entry is None or (entry["current"] and time.time() - entry["fetched_at"] > self.current_ttl):
+            return None
+        return entry
+
+    def update(self, league: str, seasons: dict, categories: dict):
+        """Adds every season of a league from its history page.
+
+        Args
+        ----
+        league : str
+            League
+        seasons : dict
+            Year the season ends in to season URL, most recent first
+        categories : dict
+            Stats category name to its URL segment, see FBRef.stats_categories
+        """
+        now = time.time()
+        with self.lock:
+            self._load()
+            for i, (year, season_url) in enumerate(seasons.items()):
+                self.entries[f"{league}/{year}"] = {
+                    "season": season_url,
+                    "fixtures": fixtures_url(season_url),
+                    "stats": {category: stats_url(season_url, category_url) for category, category_url in categories.items()},
+                    "current": i == 0,
+                    "fetched_at": now,
+                }
+            if os.path.dirname(self.fpath):
+                os.makedirs(os.path.dirname(self.fpath), exist_ok=True)
+            tmp_fpath = f"{self.fpath}.tmp"
+            with open(tmp_fpath, "w") as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp_fpath, self.fpath)
+
+
+SEASON_CATALOG = SeasonCatalog()
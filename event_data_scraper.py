@@ -45,6 +45,9 @@ if is_ubuntu():  # github actions
     display = Display(visible=0, size=(800, 800))
     display.start()
 from engines.WhoScored import WhoScored
+from engines.replay import configure_replay
+from engines.metrics import METRICS, configure_metrics
+from engines.ledger import LEDGER
 import json
 import os
 import argparse
@@ -53,8 +56,6 @@ import pandas as pd
 pd.options.mode.chained_assignment = None
 
 
-LINKS_CACHE_FPATH = "data/cache/whoscored_links.txt"
-
 
 ## Utils
 def load_season(path):  # load a json file, returns data and match_urls
@@ -334,12 +335,20 @@ if __name__ == "__main__":
     parser.add_argument("--end", type=int, help="End year", default=2024)
     parser.add_argument("--leagues", nargs="+", default=["Bundesliga", "La Liga", "Serie A", "Ligue 1", "EPL"])
     # parser.add_argument("--leagues", nargs="+", default=["EPL"])
+    parser.add_argument("--record", type=str, help="Record every fetched page into this directory")
+    parser.add_argument("--replay", type=str, help="Serve every page from a directory made with --record, without the network")
+    parser.add_argument("--replay_realtime", action="store_true", help="Replay pages with their recorded fetch times")
+    parser.add_argument("--metrics_json", type=str, help="Where to write the fetch metrics summary at exit", default="data/fetch_metrics.json")
+    parser.add_argument("--metrics_prom", type=str, help="Also write the fetch metrics as a Prometheus text file")
     args = parser.parse_args()
+    configure_metrics(json_path=args.metrics_json, prom_path=args.metrics_prom)
+    if args.record:
+        configure_replay("record", args.record)
+    elif args.replay:
+        configure_replay("replay", args.replay, realtime=args.replay_realtime)
     YEARS = list(range(args.start, args.end + 1))
     LEAGUES = args.leagues
 
-    with open(LINKS_CACHE_FPATH, "r") as f:
-        cached_urls = f.read().split()
     print("Before Scraping")
     usage = get_system_usage()
     print(f"\033[92mRAM: {usage['ram']['used']:.2f}GB/{usage['ram']['total']:.2f}GB, Free: {usage['ram']['free']:.2f}GB\033[0m")
@@ -360,7 +369,7 @@ if __name__ == "__main__":
 
                 links = get_links_with_retry(scraper, year, league)
                 print(f"Found a total of {len(links)} matches for", league, year)
-                links = [x for x in links if x not in cached_urls]
+                links = LEDGER.filter_new(links)
                 print(f"Found a total of {len(links)} new matches for", league, year, "after filtering")
                 match_data = dict(zip(links, [""] * len(links)))
 
@@ -459,10 +468,8 @@ if __name__ == "__main__":
 
             # write the matches table
             write_to_bq(all_matches, "Matches", "Lookup_Tables", write_type="APPEND")
-            # write scraped to text
-            with open(LINKS_CACHE_FPATH, "a") as f:
-                for item in match_urls:
-                    f.write("%s\n" % item)
+            # record as scraped
+            LEDGER.record_many(match_urls, "done", [json.dumps(data.get(url)).encode() for url in match_urls])
             print("Finished Parsing", league, year, ". Total Matches:", len(match_urls))
             os.remove(path)
         check_size(dataset_name="Event_Data")
@@ -1,15 +1,26 @@
 import argparse
-from engines.fbref import FBRef
+from engines.fbref import FBRef, configure_match_pipeline
+from engines.fbref_tables import MatchBatch
 import time
 import pandas as pd
 from utils import *
-from engines.request_utils import get_request
+from engines.request_utils import get_request, configure_sessions
+from engines.http_cache import configure_cache, CACHE_MODES
+from engines.replay import configure_replay
+from engines.archive import configure_archive
+from engines.metrics import METRICS, configure_metrics
+from engines.driver_pool import configure_driver_pools, DRIVER_PAGE_BUDGET
+from engines.match_logs import fetch_match_logs, MATCH_LOG_CATEGORIES
 import os
+import io
+import json
+import datetime
 import concurrent.futures
 import functools
 from selenium.common.exceptions import TimeoutException, WebDriverException, NoSuchElementException, StaleElementReferenceException, ElementClickInterceptedException, ElementNotInteractableException
 
 OVERALL_TIMEOUT = 100
+RAW_RESULTS_DIR = "data/cache/fbref_raw"  # scraped results before parse_results(), kept for --incremental runs
 
 
 # Retry decorator for WebDriver exceptions
@@ -25,14 +36,10 @@ def retry_on_webdriver_exception(max_retries=3, delay=5):
                     if attempt < max_retries - 1:
                         print(f"Retrying in {delay} seconds...")
                         time.sleep(delay)
-                        # If we have a scraper object, reinitialize it
-                        if args and hasattr(args[0], "close") and hasattr(args[0], "__init__"):
-                            try:
-                                args[0].close()
-                                args[0].__init__()
-                                print("Reinitialized scraper after WebDriver exception")
-                            except Exception as init_e:
-                                print(f"Failed to reinitialize scraper: {init_e}")
+                        # If we have a scraper object, swap its browser for a warm one from the driver pool
+                        if args and hasattr(args[0], "reset_driver"):
+                            args[0].reset_driver()
+                            print("Replaced the scraper's WebDriver after WebDriver exception")
                     else:
                         print(f"Max retries reached for {func.__name__}")
                         raise
@@ -46,9 +53,42 @@ def retry_on_webdriver_exception(max_retries=3, delay=5):
     return decorator
 
 
-def scrape_year(year: int, leagues: list, scraper: FBRef):
+def scrape_year(year: int, leagues: list, scraper_factory=FBRef.for_league, incremental: bool = False):
+    # every league gets its own scraper from scraper_factory (its own browser and HTTP sessions), so the league threads
+    # run side by side instead of fighting over one WebDriver. They still share the global fbref.com rate limit.
+    scrapers = {league: scraper_factory(league) for league in leagues}
+    try:
+        return _scrape_year(year, leagues, scrapers, incremental)
+    finally:
+        for scraper in scrapers.values():
+            scraper.close()
+
+
+def _scrape_year(year: int, leagues: list, scrapers: dict, incremental: bool):
+    # in incremental mode, only matches played after each league's high-water mark are scraped and merged into the
+    # raw results of earlier runs
+    store, marks = load_raw_results(year) if incremental else (None, {})
+    fixtures = {}
+    if incremental:
+        for league in leagues:
+            league_fixtures = scrapers[league].get_fixtures(year, league)
+            if league_fixtures is None:
+                continue
+            if league in marks:
+                league_fixtures = league_fixtures[league_fixtures["Date"].apply(lambda date: date is not None and date > marks[league])]
+            if store is not None and "Link" in store.get("player_logs", pd.DataFrame()):
+                # matches of a matchday that was still being played last run are stored already
+                league_fixtures = league_fixtures[~league_fixtures["Link"].isin(set(store["player_logs"]["Link"]))]
+            if len(league_fixtures) == 0:
+                print(f"No new {league} {year} matches since {marks.get(league)}")
+                continue
+            fixtures[league] = league_fixtures
+        leagues = list(fixtures)
+        if len(leagues) == 0:
+            return None
+
     with concurrent.futures.ThreadPoolExecutor(max_workers=len(leagues)) as executor:
-        future_to_league = {executor.submit(scrape_league, year, league, scraper): league for league in leagues}
+        future_to_league = {executor.submit(scrape_league, year, league, scrapers[league], fixtures[league]["Link"].tolist() if incremental else None): league for league in leagues}
         all_results = {}
         for future in concurrent.futures.as_completed(future_to_league):
             league = future_to_league[future]
@@ -63,16 +103,29 @@ def scrape_year(year: int, leagues: list, scraper: FBRef):
             #     print(f"Error scraping league {league}: {e}")
 
     ids = dict(zip(all_results["squad"]["Standard Squad"].tolist(), all_results["squad"]["Standard Team_ID"].tolist()))
+    if incremental:  # only teams that played since the last run
+        played = set(all_results["player_logs"]["Team ID"]) if len(all_results["player_logs"]) > 0 else set()
+        ids = {team: team_id for team, team_id in ids.items() if team_id in played}
     print(f"Total Team IDs {year} {league}: ", len(ids))
-    squad_logs = get_match_level(ids, year)
+    # incremental runs refetch the logs of the teams that just played, cached logs would miss their new matches
+    squad_logs = get_match_level(ids, year, refresh=incremental) if len(ids) > 0 else pd.DataFrame()
     all_results["squad_logs"] = squad_logs
+
+    if incremental:
+        all_results = merge_raw_results(store, all_results, leagues, ids)
+        scraped = set(all_results["player_logs"]["Link"]) if "Link" in all_results["player_logs"] else set()
+        for league in leagues:
+            marks[league] = high_water_mark(fixtures[league], scraped, marks.get(league))
+        save_raw_results(year, all_results, marks)
+
     try:
         all_results["shots"]["Minute"] = all_results["shots"]["Minute"].astype(str)
     except Exception as e:
         print(all_results["shots"].columns)
         print(e)
 
-    return parse_results(all_results)
+    with METRICS.timer("parse_results"):
+        return parse_results(all_results)
 
 
 def parse_results(results: dict):
@@ -140,8 +193,9 @@ def parse_results(results: dict):
 
     to_adjust_metrics = [x for x in merged_df.columns if ("Defense" in x) or (x.startswith("Passing"))]
     to_adjust_metrics = [x for x in to_adjust_metrics if "pct" not in x.lower()]
-    for metric in to_adjust_metrics:
-        merged_df[f"Padj_{metric.replace('Defense', 'Defensive')}"] = merged_df.apply(lambda row: possession_adjust(row, metric), axis=1)
+    padj = possession_adjust_frame(merged_df, to_adjust_metrics)
+    padj.columns = [f"Padj_{metric.replace('Defense', 'Defensive')}" for metric in to_adjust_metrics]
+    merged_df = pd.concat([merged_df, padj], axis=1)
 
     print(merged_df.columns.tolist())
     padj_df = (
@@ -164,7 +218,10 @@ def parse_results(results: dict):
     # To get accurate positioning
 
     sheet_id = "1GjjS9IRp6FVzVX5QyfmttMk8eYBtIzuZ_YIM0VWg8OY"
-    mapping_df = pd.read_csv(f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv", on_bad_lines="skip")
+    mapping_response = get_request(f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv")
+    if mapping_response is None:
+        raise Exception("Could not download the player position mapping sheet")
+    mapping_df = pd.read_csv(io.BytesIO(mapping_response.content), on_bad_lines="skip")
     mapping_df["fbref_id"] = mapping_df["UrlFBref"].apply(lambda x: x.split("players/")[1].split("/")[0])
     player_df = player_df.merge(mapping_df, how="left", left_on="Standard_Player_ID", right_on="fbref_id")
     player_df = player_df.rename(columns={"TmPos": "Position"})
@@ -180,10 +237,11 @@ def parse_results(results: dict):
         "shots": shots,
         "squad_logs": squad_logs,
         "player_logs": player_logs,
+        "keeper_logs": results["keeper_logs"],
     }
 
 
-def scrape_league(year: int, league: str, scraper: FBRef):
+def scrape_league(year: int, league: str, scraper: FBRef, links: list = None):
     # TODO: error handling
     # TODO: Logging
     # data is a dictionary with keys as category names, values are typles of 3 dataframes
@@ -193,10 +251,6 @@ def scrape_league(year: int, league: str, scraper: FBRef):
     def scrape_all_stats_with_retry(scraper, year, league):
         return scraper.scrape_all_stats(year, league)
 
-    @retry_on_webdriver_exception()
-    def scrape_matches_with_retry(scraper, year, league):
-        return scraper.scrape_matches(year, league)
-
     data = scrape_all_stats_with_retry(scraper, year, league)
     squad, squad_gks = parse_stats(data, 0)
     squad["League"] = league
@@ -208,30 +262,23 @@ def scrape_league(year: int, league: str, scraper: FBRef):
     player_stats["League"] = league
     player_gk["League"] = league
 
-    matches = scrape_matches_with_retry(scraper, year, league).dropna()
-    print(f"Found {len(matches)} completed matches", end="\r", flush=True)
-    shots = []
-    player_logs = pd.DataFrame()
-
-    @retry_on_webdriver_exception(max_retries=2, delay=3)  # Shorter retry for individual matches
-    def process_match_data(row):
-        home_players = parse_match_stats(row["Home Player Stats"], row.to_frame())
-        away_players = parse_match_stats(row["Away Player Stats"], row.to_frame())
-        combined_players = pd.concat([home_players, away_players], ignore_index=True)
-        indiv_shots = parse_shots(row["Shots"].loc["Both"], row.to_frame())
-        return combined_players, indiv_shots
-
-    for _, row in matches.iterrows():
-        try:
-            combined_players, indiv_shots = process_match_data(row)
-            player_logs = pd.concat([player_logs, combined_players], ignore_index=True)
-            shots.append(indiv_shots)
-        except Exception as e:
-            print(f"Failed to process match data: {e}")
-            continue
+    # matches are batched as they arrive, while the rest are still being fetched
+    batch = MatchBatch()
+    for match in scraper.iter_matches(year, league, links=links):
+        batch.append(match)
+    logs = parse_match_tables(batch.to_frames())
 
-    shots = pd.concat(shots, ignore_index=True) if shots else pd.DataFrame()
-    return {"squad": squad, "squad_gks": squad_gks, "against": against, "against_gks": against_gks, "player_stats": player_stats, "player_gk": player_gk, "player_logs": player_logs, "shots": shots}
+    return {
+        "squad": squad,
+        "squad_gks": squad_gks,
+        "against": against,
+        "against_gks": against_gks,
+        "player_stats": player_stats,
+        "player_gk": player_gk,
+        "player_logs": logs["players"],
+        "keeper_logs": logs["keepers"],
+        "shots": logs["shots"],
+    }
 
 
 ### UTILS ###
@@ -248,7 +295,7 @@ def parse_stats(data, index):
             df = pd.merge(df, x, how="left", left_on=left_col, right_on=right_col)
 
         df = df.loc[:, ~df.columns.duplicated()]
-        df = df.T.drop_duplicates().T
+        df = dedupe_columns(df)
         return df
 
     def fix_columns(df, key):
@@ -266,48 +313,83 @@ def parse_stats(data, index):
     return df, gk_df
 
 
-def parse_match_stats(one: pd.Series, main):
-    raw = one.iloc[1:].to_dict(orient="index")
-    dfs = []
-    for key in raw:
-        curr = raw.get(key)[0]
-        cols = curr.columns.tolist()
-        parsed = []
-        for col in cols:
-            if "Unnamed" in col[0]:
-                parsed.append(col[1])
-            elif col[0] == col[1]:
-                parsed.append(col[0])
-            else:
-                parsed.append(col[0] + " " + col[1])
-        curr.columns = [key.title() + " " + x.strip().replace(" ", "_") for x in parsed]
-        dfs.append(curr)
-    parsed = pd.concat(dfs, axis=1).iloc[:-1]
-    parsed = pd.concat(dfs, axis=1).iloc[:-1]
-    for x in ["Date", "Stage", "Home Team", "Away Team", "Home Goals", "Away Goals"]:
-        parsed[x.strip().replace(" ", "_")] = main.loc[x].item()
-    parsed["Date"] = pd.to_datetime(parsed["Date"])
-    return parsed
-
-
-def parse_shots(one: pd.Series, main):
-    cols = one.columns.tolist()
-    parsed = []
-    for col in cols:
-        if "Unnamed" in col[0]:
-            parsed.append(col[1])
-        elif col[0] == col[1]:
-            parsed.append(col[0])
+def parse_match_tables(tables: dict):
+    # adds the match details to the player, keeper and shot rows of completed matches
+    if len(tables["matches"]) == 0:
+        return {name: pd.DataFrame() for name in ["players", "keepers", "shots"]}
+    matches = tables["matches"].dropna()  # only completed matches
+    print(f"Found {len(matches)} completed matches", end="\r", flush=True)
+    info = matches[["Link", "Date", "Stage", "Home Team", "Away Team", "Home Goals", "Away Goals"]].copy()
+    info.columns = [x.strip().replace(" ", "_") for x in info.columns]
+    info["Date"] = pd.to_datetime(info["Date"])
+
+    logs = {}
+    for name in ["players", "keepers", "shots"]:
+        df = tables[name]
+        logs[name] = df.merge(info, on="Link", how="inner").sort_values(by="Date", kind="stable", ignore_index=True) if len(df) > 0 else pd.DataFrame()
+    return logs
+
+
+def load_raw_results(year: int):
+    # raw results of earlier incremental runs and their high-water marks, {league: date of the last scraped matchday}
+    path = os.path.join(RAW_RESULTS_DIR, str(year))
+    try:
+        with open(os.path.join(path, "marks.json"), "r") as f:
+            marks = {league: datetime.date.fromisoformat(date) for league, date in json.load(f).items()}
+    except (OSError, ValueError, AttributeError, TypeError) as e:
+        if os.path.exists(os.path.join(path, "marks.json")):
+            print(f"Unreadable {os.path.join(path, 'marks.json')}, starting over: {e}")
+        return None, {}  # no (usable) previous run
+    store = {fname[: -len(".pkl.gz")]: pd.read_pickle(os.path.join(path, fname)) for fname in os.listdir(path) if fname.endswith(".pkl.gz")}
+    return store, marks
+
+
+def save_raw_results(year: int, results: dict, marks: dict):
+    path = os.path.join(RAW_RESULTS_DIR, str(year))
+    os.makedirs(path, exist_ok=True)
+    for key, df in results.items():
+        df.to_pickle(os.path.join(path, f"{key}.pkl.gz"))
+    # written last and atomically, the store is only used once it exists. Leagues without a mark (nothing scraped up to
+    # their first fixture yet) are left out so that the next run starts them from scratch
+    tmp_fpath = os.path.join(path, "marks.json.tmp")
+    with open(tmp_fpath, "w") as f:
+        json.dump({league: date.isoformat() for league, date in marks.items() if date is not None}, f, indent=2)
+    os.replace(tmp_fpath, os.path.join(path, "marks.json"))
+
+
+def merge_raw_results(store: dict, new: dict, leagues: list, team_ids: dict):
+    # season totals of the scraped leagues and the match logs of the updated teams are replaced, new matches appended
+    if store is None:
+        return new
+    merged = {}
+    for key in set(store) | set(new):
+        old = store.get(key, pd.DataFrame())
+        df = new.get(key, pd.DataFrame())
+        if len(old) == 0 or len(df) == 0:
+            merged[key] = df if len(old) == 0 else old
+            continue
+        if key in ["player_logs", "keeper_logs", "shots"]:
+            old = old[~old["Link"].isin(set(df["Link"]))]
+        elif key == "squad_logs":
+            old = old[~old["Squad"].isin(set(team_ids))]
         else:
-            parsed.append(col[0] + " " + col[1])
-    one.columns = [x.strip().replace(" ", "_") for x in parsed]
-    for x in ["Date", "Stage", "Home Team", "Away Team", "Home Goals", "Away Goals"]:
-        one[x.strip().replace(" ", "_")] = main.loc[x].item()
-    one["Date"] = pd.to_datetime(one["Date"])
-    return one
+            old = old[~old["League"].isin(leagues)]
+        merged[key] = pd.concat([old, df], ignore_index=True)
+    return merged
+
 
+def high_water_mark(fixtures: pd.DataFrame, scraped: set, mark=None):
+    # the last date up to which every played match has been scraped. Fixtures only get a link once they are played,
+    # so the mark stops at yesterday, later kick-offs of today would otherwise never be scraped
+    missing = fixtures[~fixtures["Link"].isin(scraped)]["Date"].dropna()
+    done = fixtures["Date"].dropna()
+    if len(missing) > 0:
+        done = done[done < missing.min()]
+    done = done[done < datetime.date.today()]
+    return max([done.max()] + ([mark] if mark else [])) if len(done) > 0 else mark
 
-def get_match_level(teams, season):  # get individual match level data
+
+def get_match_level(teams, season, refresh=False):  # get individual match level data
     def fix_penalty(df):
         penfor = df["GF"].apply(lambda x: str(x).split()[-1].replace("(", "").replace(")", "") if (len(str(x).split()) > 1) else 0)
         penagainst = df["GA"].apply(lambda x: str(x).split()[-1].replace("(", "").replace(")", "") if (len(str(x).split()) > 1) else 0)
@@ -317,36 +399,33 @@ def get_match_level(teams, season):  # get individual match level data
         df.insert(11, "penagainst", penagainst)
         return df
 
-    @retry_on_webdriver_exception(max_retries=2, delay=3)
-    def get_match_logs_with_retry(team_id, season, team):
-        return get_match_logs(team_id, season, team)
-
+    logs = fetch_match_logs(teams, season, refresh=refresh)  # every team's pages at once, under the shared rate limit
     dfs = []
     for team in teams:
+        if team not in logs:
+            continue  # fetch_match_logs already reported the failed pages
         try:
-            tmp = get_match_logs_with_retry(teams.get(team), season, team)
-            dfs.append(tmp)
+            dfs.append(get_match_logs(teams.get(team), season, team, logs[team]))
         except Exception as e:
             print(f"Failed to get match logs for team {team}: {e}")
             continue
 
     df = pd.concat(dfs, ignore_index=True)
     df = df.dropna(thresh=35).fillna(0)
-    df = df.T.drop_duplicates().T
+    df = dedupe_columns(df)
     df = fix_penalty(df)
     r = df.drop("Date", axis=1).apply(pd.to_numeric, errors="ignore")
     r["Date"] = df["Date"]
     return r.drop_duplicates()
 
 
-def get_match_logs(id, year, team):
-    print("Scraping", team, "for", year, end="\r", flush=True)
-    prefixes = ["shooting", "keeper", "passing", "passing_types", "gca", "defense", "possession", "misc"]
-    starting_url = f"https://fbref.com/en/squads/{id}/{year-1}-{year}/matchlogs/all_comps/"
+def get_match_logs(id, year, team, tables=None):
+    # tables are the decoded match log pages from fetch_match_logs(), fetched here when not given
+    if tables is None:
+        tables = fetch_match_logs({team: id}, year)[team]
     dfs = []
-    for prefix in prefixes:
-        newurl = starting_url + prefix
-        tmp = pd.read_html(get_request(new_url).content)[0]
+    for prefix in MATCH_LOG_CATEGORIES:
+        tmp = tables[prefix].copy()
         cols = tmp.columns.tolist()
         parsed = []
         for col in cols:
@@ -360,8 +439,7 @@ def get_match_logs(id, year, team):
         dfs.append(tmp)
     df = pd.concat(dfs, axis=1)
     df = df.drop([x for x in df.columns.tolist() if ("Notes" in x) | ("Match_Report" in x)], axis=1)
-    new_url = starting_url + "schedule"
-    tmp = pd.read_html(new_url)[0].drop(["Match Report", "Notes"], axis=1, errors="ignore")
+    tmp = tables["schedule"].drop(["Match Report", "Notes"], axis=1, errors="ignore")
     df = tmp.merge(df, how="right", left_on="Date", right_on="Shooting_Date")
     df.insert(1, "Squad", team)
     df = df.replace("Champions Lg", "Champions League").replace("Europa Lg", "Europa League")
@@ -387,7 +465,7 @@ def parse_columns(df: pd.DataFrame):
     ]
     new = [x.strip("_") for x in new]
     df.columns = new
-    df = df.T.drop_duplicates().T
+    df = dedupe_columns(df)
     df = df.drop_duplicates()
     df.drop(["Standard_Matches", "Standard_Rk", "Standard Matches"], axis=1, inplace=True, errors="ignore")
     return df.loc[:, ~df.columns.duplicated()]
@@ -411,14 +489,37 @@ if __name__ == "__main__":
     # parser.add_argument("--leagues", nargs="+", help="Leagues included are for eg ['EPL', 'La Liga', 'Serie A', 'Ligue 1', 'Bundesliga', 'Eredivisie', 'Primeira Liga']", default=["EPL", "La Liga", "Serie A", "Ligue 1", "Bundesliga"])
 
     parser.add_argument("--write_type", type=str, help="Write Type", default="WRITE_TRUNCATE")
+    parser.add_argument("--incremental", action="store_true", help="Only scrape matches played since the last incremental run and merge them into its results")
+    parser.add_argument("--pool_size", type=int, help="Keep-alive connections per host", default=20)
+    parser.add_argument("--fetch_workers", type=int, help="Concurrent match page requests per league")
+    parser.add_argument("--parse_workers", type=int, help="Processes in the match parsing pool shared by all leagues, default one per core")
+    parser.add_argument("--driver_page_budget", type=int, help="Pages a browser loads before it is recycled", default=DRIVER_PAGE_BUDGET)
+    parser.add_argument("--cache_mode", type=str, choices=CACHE_MODES, help="HTTP cache mode, 'only' never hits the network", default="on")
+    parser.add_argument("--record", type=str, help="Record every fetched page into this directory")
+    parser.add_argument("--replay", type=str, help="Serve every page from a directory made with --record, without the network")
+    parser.add_argument("--replay_realtime", action="store_true", help="Replay pages with their recorded fetch times")
+    parser.add_argument("--from_archive", action="store_true", help="Rebuild every output by reparsing the page archive, without the network")
+    parser.add_argument("--no_archive", action="store_true", help="Don't add fetched pages to the page archive")
+    parser.add_argument("--metrics_json", type=str, help="Where to write the fetch metrics summary at exit", default="data/fetch_metrics.json")
+    parser.add_argument("--metrics_prom", type=str, help="Also write the fetch metrics as a Prometheus text file")
     args = parser.parse_args()
+    configure_metrics(json_path=args.metrics_json, prom_path=args.metrics_prom)
+    configure_sessions(args.pool_size)
+    configure_driver_pools(page_budget=args.driver_page_budget)
+    configure_match_pipeline(fetch_workers=args.fetch_workers, parse_workers=args.parse_workers)
+    configure_cache(mode=args.cache_mode)
+    configure_archive(mode="only" if args.from_archive else "off" if args.no_archive else "on")
+    if args.record:
+        configure_replay("record", args.record)
+    elif args.replay:
+        configure_replay("replay", args.replay, realtime=args.replay_realtime)
     years = range(args.start, args.end + 1)
-    fbref_scraper = FBRef()
 
     os.makedirs("data", exist_ok=True)
     for year in years:
-        results = scrape_year(year, args.leagues, fbref_scraper)
+        results = scrape_year(year, args.leagues, incremental=args.incremental)
+        if results is None:
+            print(f"No new matches for {year}, keeping the existing data")
+            continue
         for k, v in results.items():
             v.to_csv(f"data/{year}_{k}.csv", index=False)
-
-    fbref_scraper.close()
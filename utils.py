@@ -1,5 +1,6 @@
 import os
 import json
+import numpy as np
 import pandas as pd
 from google.cloud import bigquery
 import difflib
@@ -72,12 +73,39 @@ def find_closest_matches(list1: list, list2: list):
     return matches
 
 
+def dedupe_columns(df: pd.DataFrame):  # drops columns that repeat an earlier column's values, like df.T.drop_duplicates().T
+    # each column is fingerprinted by its dtype and a vectorized hash of its values, so the frame is never transposed
+    # and keeps its dtypes. Equal fingerprints are confirmed with Series.equals in case of a hash collision
+    seen = {}
+    keep = []
+    for i in range(df.shape[1]):
+        col = df.iloc[:, i]
+        key = (str(col.dtype), hash(pd.util.hash_pandas_object(col, index=False).values.tobytes()))
+        if any(col.equals(df.iloc[:, j]) for j in seen.get(key, [])):
+            continue
+        seen.setdefault(key, []).append(i)
+        keep.append(i)
+    return df.take(keep, axis=1) if len(keep) < df.shape[1] else df
+
+
 def possession_adjust(row: pd.Series, metric: str):
     opp_possession = 100 - row["Poss"]
     assert opp_possession >= 0, f"{row['Poss']} is not a valid possession value for metric {metric}"
     return row[metric] / opp_possession * 50
 
 
+def possession_adjust_frame(df: pd.DataFrame, metrics: list, dtype=np.float64):  # possession_adjust for every metric and row at once
+    # one numpy broadcast of metric / opponent possession * 50, returned as a frame with one column per metric on
+    # df's index. Rows without a possession value come out as NaN, possession outside 0-100 is an error
+    possession = pd.to_numeric(df["Poss"]).to_numpy(dtype=np.float64)
+    invalid = (possession < 0) | (possession > 100)
+    assert not invalid.any(), f"{np.unique(possession[invalid]).tolist()} are not valid possession values"
+    values = df[metrics].to_numpy(dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        adjusted = values / (100 - possession)[:, None] * 50
+    return pd.DataFrame(adjusted.astype(dtype, copy=False), index=df.index, columns=metrics)
+
+
 def find_most_similar_string(string: str, list_of_strings: list):
     matches = difflib.get_close_matches(string, list_of_strings)
     if len(matches) > 0: